@@ -0,0 +1,209 @@
+"""
+Controle de admissão das rotas caras (dashboard e uploads).
+
+Cada limitador tem um limite global e um por usuário de requisições em
+andamento. Quem passa do limite espera numa fila limitada (global e por
+usuário), por no máximo ADMISSION_<NOME>_TIMEOUT segundos. Fila cheia ou
+espera estourada devolvem:
+
+- 429, se o limite do próprio usuário é o motivo;
+- 503, se o servidor inteiro está ocupado;
+
+sempre com Retry-After, estimado pelo tempo médio que as requisições seguram
+a vaga. Os limites valem por processo, como o pool de conexões.
+
+Os uploads ocupam a vaga pela dependência `admission()`. O dashboard só
+ocupa a vaga ao calcular uma resposta que não estava em cache
+(cached_json_response_async): acertos no cache, 304 e requisições iguais
+que esperam o mesmo cálculo não passam pelo limitador.
+
+Configuração por limitador (NOME = DASHBOARD ou UPLOAD):
+ADMISSION_<NOME>_CONCURRENCY, _PER_USER, _QUEUE, _PER_USER_QUEUE e _TIMEOUT.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from os import getenv
+from fastapi import Depends, HTTPException, status
+from app.depends import decode_token, oauth_scheme
+
+
+# Peso da última requisição na média do tempo de uso da vaga
+HOLD_SECONDS_WEIGHT = 0.2
+
+
+def _setting(name: str, key: str, default, cast=int):
+    return cast(getenv(f'ADMISSION_{name.upper()}_{key}', default))
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, concurrency: int, per_user: int, queue: int, per_user_queue: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.per_user = per_user
+        self.queue = queue
+        self.per_user_queue = per_user_queue
+        self.timeout = timeout
+
+        self.active = 0
+        self._active_per_user = {}
+        # (usuário, future) na ordem de chegada
+        self._waiters = deque()
+        self._waiting_per_user = {}
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {'user': 0, 'queue': 0, 'timeout': 0}
+        self.wait_seconds = 0.0
+        self.hold_seconds = 1.0
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, per_user: int, queue: int, per_user_queue: int, timeout: float):
+        return cls(
+            name,
+            _setting(name, 'CONCURRENCY', concurrency),
+            _setting(name, 'PER_USER', per_user),
+            _setting(name, 'QUEUE', queue),
+            _setting(name, 'PER_USER_QUEUE', per_user_queue),
+            _setting(name, 'TIMEOUT', timeout, float)
+        )
+
+    def _can_run(self, user) -> bool:
+        return self.active < self.concurrency and self._active_per_user.get(user, 0) < self.per_user
+
+    def _start(self, user):
+        self.active += 1
+        self._active_per_user[user] = self._active_per_user.get(user, 0) + 1
+
+    def _finish(self, user):
+        self.active -= 1
+        remaining = self._active_per_user[user] - 1
+        if remaining:
+            self._active_per_user[user] = remaining
+        else:
+            del self._active_per_user[user]
+        self._wake()
+
+    def _dequeue(self, item):
+        self._waiters.remove(item)
+        user = item[0]
+        remaining = self._waiting_per_user[user] - 1
+        if remaining:
+            self._waiting_per_user[user] = remaining
+        else:
+            del self._waiting_per_user[user]
+
+    def _wake(self):
+        # Libera, em ordem de chegada, quem já pode rodar; um usuário no
+        # limite dele não segura a fila dos outros
+        for item in list(self._waiters):
+            if self.active >= self.concurrency:
+                break
+            user, future = item
+            if not future.done() and self._can_run(user):
+                self._dequeue(item)
+                self._start(user)
+                future.set_result(None)
+
+    def _retry_after(self, user, reason: str) -> int:
+        if reason == 'user' or self._active_per_user.get(user, 0) >= self.per_user:
+            ahead, slots = self._waiting_per_user.get(user, 0), self.per_user
+        else:
+            ahead, slots = len(self._waiters), self.concurrency
+        return max(1, math.ceil(self.hold_seconds * (ahead + 1) / slots))
+
+    def _reject(self, user, reason: str):
+        self.rejected[reason] += 1
+        if reason == 'user' or self._active_per_user.get(user, 0) >= self.per_user:
+            status_code, detail = status.HTTP_429_TOO_MANY_REQUESTS, 'Too many concurrent requests'
+        else:
+            status_code, detail = status.HTTP_503_SERVICE_UNAVAILABLE, 'Server busy, try again later'
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={'Retry-After': str(self._retry_after(user, reason))}
+        )
+
+    async def _wait(self, user):
+        if self._waiting_per_user.get(user, 0) >= self.per_user_queue:
+            self._reject(user, 'user')
+        if len(self._waiters) >= self.queue:
+            self._reject(user, 'queue')
+
+        item = (user, asyncio.get_running_loop().create_future())
+        self._waiters.append(item)
+        self._waiting_per_user[user] = self._waiting_per_user.get(user, 0) + 1
+        self.queued += 1
+
+        try:
+            await asyncio.wait_for(item[1], self.timeout)
+        except BaseException as e:
+            if item[1].done() and not item[1].cancelled():
+                # Ganhou a vaga junto com o cancelamento: devolve
+                self._finish(user)
+            elif item in self._waiters:
+                self._dequeue(item)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(user, 'timeout')
+            raise
+
+    @asynccontextmanager
+    async def slot(self, user):
+        start = time.monotonic()
+        if self._can_run(user) and not self._waiting_per_user.get(user):
+            self._start(user)
+        else:
+            await self._wait(user)
+
+        admitted_at = time.monotonic()
+        self.admitted += 1
+        self.wait_seconds += admitted_at - start
+        try:
+            yield
+        finally:
+            held = time.monotonic() - admitted_at
+            self.hold_seconds += HOLD_SECONDS_WEIGHT * (held - self.hold_seconds)
+            self._finish(user)
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "concurrency": self.concurrency,
+            "per_user": self.per_user,
+            "queue": self.queue,
+            "per_user_queue": self.per_user_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "wait_seconds": round(self.wait_seconds, 3),
+            "hold_seconds": round(self.hold_seconds, 3)
+        }
+
+
+admission_limiters = {
+    'dashboard': AdmissionLimiter.from_env(
+        'dashboard', concurrency=16, per_user=2, queue=64, per_user_queue=4, timeout=5
+    ),
+    # Uploads leem o arquivo inteiro e gravam os bytes no banco
+    'upload': AdmissionLimiter.from_env(
+        'upload', concurrency=4, per_user=1, queue=16, per_user_queue=2, timeout=30
+    ),
+}
+
+
+def admission(name: str):
+    """
+    Dependência que segura uma vaga do limitador `name` enquanto a rota roda.
+    O usuário sai do token, sem ir ao banco.
+    """
+    limiter = admission_limiters[name]
+
+    async def dependency(token: str = Depends(oauth_scheme)):
+        username, user_id = decode_token(token)
+        async with limiter.slot(user_id if user_id is not None else username):
+            yield
+
+    return dependency
@@ -1,6 +1,12 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from fastapi import status
 from fastapi.exceptions import HTTPException
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from passlib.context import CryptContext
@@ -13,7 +19,153 @@ from app.schemas import User
 SECRET_KEY = getenv('SECRET_KEY')
 ALGORITHM = getenv('ALGORITHM')
 
-crypt_context = CryptContext(schemes=['sha256_crypt'])
+# O primeiro esquema é usado nos hashes novos; os demais só são aceitos no
+# login e trocados pelo atual (rehash) quando o usuário entra
+PASSWORD_SCHEMES = [scheme.strip() for scheme in getenv('PASSWORD_SCHEMES', 'sha256_crypt').split(',')]
+PASSWORD_ROUNDS = getenv('PASSWORD_ROUNDS')
+PASSWORD_HASH_WORKERS = int(getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_PENDING = int(getenv('PASSWORD_HASH_MAX_PENDING', 32))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+
+
+def _build_crypt_context() -> CryptContext:
+    settings = {}
+    if PASSWORD_ROUNDS:
+        # min/max iguais ao padrão: hashes com outro número de rounds precisam de rehash
+        for option in ('default_rounds', 'min_rounds', 'max_rounds'):
+            settings[f'{PASSWORD_SCHEMES[0]}__{option}'] = int(PASSWORD_ROUNDS)
+    # Mantém o esquema original para os hashes já gravados continuarem válidos
+    schemes = PASSWORD_SCHEMES + [scheme for scheme in ['sha256_crypt'] if scheme not in PASSWORD_SCHEMES]
+    return CryptContext(schemes=schemes, deprecated='auto', **settings)
+
+
+crypt_context = _build_crypt_context()
+
+
+def _hash_password(password: str) -> str:
+    return crypt_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple:
+    return crypt_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Roda o hash e a verificação de senha (CPU, segura o GIL) em um pool de
+    processos próprio, fora do threadpool que atende as outras rotas.
+    No máximo `max_pending` operações ficam em andamento ou na fila; acima
+    disso a requisição espera até `queue_timeout` e recebe 503.
+    Com `workers=0` roda na própria thread.
+    """
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._admission = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._admission.acquire(timeout=self.queue_timeout):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many login attempts in progress, try again',
+                headers={'Retry-After': str(max(1, int(self.queue_timeout)))}
+            )
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._admission.release()
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash_password, password)
+
+    def verify_and_update(self, password: str, hashed: str) -> tuple:
+        return self._run(_verify_and_update, password, hashed)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    queue_timeout=PASSWORD_HASH_QUEUE_TIMEOUT
+)
+
+PRINCIPAL_CACHE_MAXSIZE = int(getenv('PRINCIPAL_CACHE_MAXSIZE', 10000))
+PRINCIPAL_CACHE_TTL = float(getenv('PRINCIPAL_CACHE_TTL', 60))
+
+
+# Usuário autenticado, desacoplado da sessão do banco
+Principal = namedtuple('Principal', ['id', 'username'])
+
+
+class PrincipalCache:
+    """
+    Cache LRU + TTL dos usuários autenticados, por id, para não consultar a
+    tabela users em toda requisição. Remoção ou alteração do usuário
+    invalida a entrada (ver os eventos de UserModel abaixo).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+
+            principal, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def set(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(maxsize=PRINCIPAL_CACHE_MAXSIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+@event.listens_for(UserModel, 'after_update')
+@event.listens_for(UserModel, 'after_delete')
+def _invalidate_principal(mapper, connection, target):
+    principal_cache.invalidate(target.id)
 
 
 class UserUseCases:
@@ -24,7 +176,7 @@ class UserUseCases:
     def user_register(self, user: User):
         user_model = UserModel(
             username=user.username,
-            password=crypt_context.hash(user.password)
+            password=password_hasher.hash(user.password)
         )
         try:
             self.db_session.add(user_model)
@@ -44,19 +196,29 @@ class UserUseCases:
                 detail='Invalid username or password'
             )
         
-        if not crypt_context.verify(user.password, user_on_db.password):
+        valid, new_hash = password_hasher.verify_and_update(user.password, user_on_db.password)
+
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail='Invalid username or password'
             )
+
+        # Esquema ou rounds mudaram desde o último login: grava o hash novo
+        if new_hash is not None:
+            user_on_db.password = new_hash
+            self.db_session.commit()
         
         exp = datetime.utcnow() + timedelta(minutes=expires_in)
 
         payload = {
             'sub': user.username,
+            'uid': user_on_db.id,
             'exp': exp
         }
 
+        principal_cache.set(Principal(id=user_on_db.id, username=user_on_db.username))
+
         access_token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
         return {
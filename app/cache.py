@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from os import getenv
+from fastapi import Request, status
+from fastapi.responses import ORJSONResponse, Response
+
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'expires_at'])
+
+
+class AsyncSingleFlight:
+    """
+    Junta chamadas concorrentes com a mesma chave (coroutines no event loop):
+    a primeira executa `compute()`, as outras esperam e recebem o mesmo
+    resultado, ou a mesma exceção. Se a requisição que está calculando for
+    cancelada, uma das que esperavam assume o cálculo.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, compute):
+        while (future := self._calls.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Sem ninguém esperando, evita o aviso de exceção não lida
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+class ResponseCache:
+    """
+    Cache LRU + TTL, em memória do processo, das respostas de leitura por usuário.
+    As entradas de um usuário são invalidadas sempre que ele altera seus dados.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.inflight_async = AsyncSingleFlight()
+
+    @staticmethod
+    def make_key(endpoint: str, user_id: int, date_selected: list = None, id_historico: int = None, **params):
+        return (
+            endpoint,
+            user_id,
+            tuple(sorted(set(date_selected or []))),
+            id_historico,
+            tuple(sorted(params.items()))
+        )
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self, user_id: int) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def set(self, key, body: bytes, generation: int = None) -> CachedResponse:
+        user_id = key[1]
+        entry = CachedResponse(
+            body=body,
+            etag='"%s"' % hashlib.sha1(body).hexdigest(),
+            expires_at=time.monotonic() + self.ttl
+        )
+
+        with self._lock:
+            # Os dados mudaram enquanto a resposta era calculada: não guarda
+            if generation is not None and generation != self._generations.get(user_id, 0):
+                return entry
+
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+        return entry
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in self._keys_by_user.pop(user_id, set()):
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'coalesced': self.inflight_async.coalesced
+            }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[1]]
+
+
+response_cache = ResponseCache(
+    maxsize=int(getenv('RESPONSE_CACHE_MAXSIZE', 1024)),
+    ttl=float(getenv('RESPONSE_CACHE_TTL', 300))
+)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+async def cached_json_response_async(request: Request, key, compute, limiter=None) -> Response:
+    """
+    Devolve a resposta em cache para `key` ou calcula com `await compute()`.
+    Responde 304 quando o cliente já tem a versão atual (If-None-Match).
+
+    Requisições iguais que chegam enquanto a resposta é calculada esperam e
+    usam o mesmo cálculo. A geração do usuário entra na chave: quem chega
+    depois de uma escrita não recebe o cálculo anterior a ela.
+    Com `limiter` (app.admission), só a requisição que de fato calcula ocupa
+    uma vaga: acertos no cache, 304 e quem espera o mesmo cálculo não contam.
+    """
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation(key[1])
+
+        async def compute_entry():
+            if limiter is None:
+                return response_cache.set(key, ORJSONResponse(content=await compute()).body, generation)
+            async with limiter.slot(key[1]):
+                return response_cache.set(key, ORJSONResponse(content=await compute()).body, generation)
+
+        entry = await response_cache.inflight_async.do((key, generation), compute_entry)
+
+    return _entry_response(request, entry)
+
+
+def _entry_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {'ETag': entry.etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(
+        content=entry.body,
+        status_code=status.HTTP_200_OK,
+        media_type='application/json',
+        headers=headers
+    )
@@ -0,0 +1,213 @@
+from collections import namedtuple
+from datetime import timedelta
+from os import getenv
+from sqlalchemy import Date, and_, cast, func, or_, select, true
+from app.filters import month_filter, next_month
+from database.models import DashboardRollup, PlanilhaModel
+
+
+Agregado = namedtuple('Agregado', ['mes', 'valor', 'total_vendas', 'total_valor_bruto', 'total_valor_liquido'])
+
+# Da mais fina para a mais grossa; se a série passar de DASHBOARD_MAX_POINTS
+# pontos, usa a próxima granularidade da lista
+GRANULARIDADES = ('day', 'week', 'month', 'quarter', 'year')
+
+DASHBOARD_MAX_POINTS = int(getenv('DASHBOARD_MAX_POINTS', 120))
+
+
+def build_dashboard_query(user_id: int, months: list = None, id_historico: int = None):
+    """
+    Monta a query do dashboard sobre `dashboard_rollup`: uma linha por
+    (dimensão, mês, valor), independente do número de vendas.
+
+    Os meses sem nenhuma venda selecionada só aparecem na dimensão `total`,
+    que alimenta a lista `dates` com todos os meses do usuário.
+    """
+    filters = []
+    if months:
+        filters.append(month_filter(DashboardRollup.mes, months))
+    if id_historico:
+        filters.append(DashboardRollup.historic_dashboard_id == id_historico)
+
+    selecionada = and_(*filters) if filters else true()
+
+    return (
+        select(
+            DashboardRollup.dimensao,
+            DashboardRollup.mes,
+            DashboardRollup.valor,
+            func.sum(DashboardRollup.total_vendas).filter(selecionada).label('total_vendas'),
+            func.sum(DashboardRollup.total_valor_bruto).filter(selecionada).label('total_valor_bruto'),
+            func.sum(DashboardRollup.total_valor_liquido).filter(selecionada).label('total_valor_liquido')
+        )
+        .where(
+            DashboardRollup.user_id == user_id,
+            or_(DashboardRollup.dimensao == 'total', selecionada)
+        )
+        .group_by(DashboardRollup.dimensao, DashboardRollup.mes, DashboardRollup.valor)
+    )
+
+
+def _somar_por_valor(rows: list) -> list:
+    totais = {}
+    for row in rows:
+        vendas, bruto, liquido = totais.get(row.valor, (0, 0, 0))
+        totais[row.valor] = (
+            vendas + row.total_vendas,
+            bruto + row.total_valor_bruto,
+            liquido + row.total_valor_liquido
+        )
+    # Mais vendidos primeiro (o dashboard mostra os 6 primeiros e junta o
+    # resto em "Outros"); empate pela chave, para a ordem ser estável
+    ordem = sorted(totais, key=lambda valor: (-totais[valor][0], valor))
+    return [Agregado(None, valor, *totais[valor]) for valor in ordem]
+
+
+def summarize_dashboard_rows(rows) -> dict:
+    """
+    Separa as linhas da query do dashboard por dimensão.
+    Os valores de cada dimensão são somados entre os meses selecionados.
+    """
+    meses = []
+    meses_selecionados = []
+    por_dimensao = {'forma_pagamento': [], 'categoria_produto': [], 'nome_produto': [], 'dia_semana': []}
+
+    for row in rows:
+        if row.dimensao == 'total':
+            meses.append(row.mes)
+            if row.total_vendas:
+                meses_selecionados.append(Agregado(row.mes, None, row.total_vendas, row.total_valor_bruto, row.total_valor_liquido))
+        elif row.total_vendas:
+            por_dimensao[row.dimensao].append(
+                Agregado(row.mes, row.valor, row.total_vendas, row.total_valor_bruto, row.total_valor_liquido)
+            )
+
+    meses.sort()
+    meses_selecionados.sort(key=lambda row: row.mes)
+
+    total = None
+    if meses_selecionados:
+        total = Agregado(
+            None,
+            None,
+            sum(row.total_vendas for row in meses_selecionados),
+            sum(row.total_valor_bruto for row in meses_selecionados),
+            sum(row.total_valor_liquido for row in meses_selecionados)
+        )
+
+    return {
+        'meses': meses,
+        'meses_selecionados': meses_selecionados,
+        'forma_pagamento': por_dimensao['forma_pagamento'],
+        'categorias': _somar_por_valor(por_dimensao['categoria_produto']),
+        'produtos': _somar_por_valor(por_dimensao['nome_produto']),
+        'dias_semana': _somar_por_valor(por_dimensao['dia_semana']),
+        'total': total
+    }
+
+
+def count_periods(granularity: str, start, end) -> int:
+    # Número de pontos da série entre os dias start e end (inclusive)
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return ((end - timedelta(days=end.weekday())) - (start - timedelta(days=start.weekday()))).days // 7 + 1
+    months = (end.year - start.year) * 12 + end.month - start.month
+    if granularity == 'month':
+        return months + 1
+    if granularity == 'quarter':
+        return (end.year - start.year) * 4 + (end.month - 1) // 3 - (start.month - 1) // 3 + 1
+    return end.year - start.year + 1
+
+
+def effective_granularity(granularity: str, meses_selecionados: list) -> str:
+    """
+    A granularidade pedida ou, se ela der mais de DASHBOARD_MAX_POINTS pontos
+    entre o primeiro e o último mês com vendas selecionadas, a primeira mais
+    grossa que caiba.
+    """
+    if not meses_selecionados:
+        return granularity
+
+    start = meses_selecionados[0].mes
+    end = next_month(meses_selecionados[-1].mes) - timedelta(days=1)
+    candidates = GRANULARIDADES[GRANULARIDADES.index(granularity):]
+    for candidate in candidates:
+        if count_periods(candidate, start, end) <= DASHBOARD_MAX_POINTS:
+            return candidate
+    return candidates[-1]
+
+
+def build_series_query(user_id: int, granularity: str, months: list = None, id_historico: int = None):
+    """
+    Série de faturamento por período e forma de pagamento numa query agrupada.
+
+    Mês, trimestre e ano saem do rollup (que é mensal); dia e semana precisam
+    das vendas, agrupadas por date_trunc em `planilhas`.
+    """
+    if granularity in ('day', 'week'):
+        model, data, valor = PlanilhaModel, PlanilhaModel.data_venda, PlanilhaModel.forma_pagamento
+        vendas = func.count()
+        bruto, liquido = PlanilhaModel.valor_bruto, PlanilhaModel.valor_liquido
+        filters = [PlanilhaModel.user_id == user_id]
+    else:
+        model, data, valor = DashboardRollup, DashboardRollup.mes, DashboardRollup.valor
+        vendas = func.sum(DashboardRollup.total_vendas)
+        bruto, liquido = DashboardRollup.total_valor_bruto, DashboardRollup.total_valor_liquido
+        filters = [DashboardRollup.user_id == user_id, DashboardRollup.dimensao == 'forma_pagamento']
+
+    if months:
+        filters.append(month_filter(data, months))
+    if id_historico:
+        filters.append(model.historic_dashboard_id == id_historico)
+
+    periodo = cast(func.date_trunc(granularity, data), Date).label('periodo')
+    return (
+        select(
+            periodo,
+            valor.label('valor'),
+            vendas.label('total_vendas'),
+            func.sum(bruto).label('total_valor_bruto'),
+            func.sum(liquido).label('total_valor_liquido')
+        )
+        .where(*filters)
+        .group_by(periodo, valor)
+    )
+
+
+def summarize_series_rows(rows) -> tuple:
+    # (totais por período, linhas por período e forma de pagamento), em ordem de período
+    totais = {}
+    por_forma = []
+    for row in rows:
+        vendas, bruto, liquido = totais.get(row.periodo, (0, 0, 0))
+        totais[row.periodo] = (vendas + row.total_vendas, bruto + row.total_valor_bruto, liquido + row.total_valor_liquido)
+        por_forma.append(Agregado(row.periodo, row.valor, row.total_vendas, row.total_valor_bruto, row.total_valor_liquido))
+
+    por_forma.sort(key=lambda row: row.mes)
+    return [Agregado(periodo, None, *totais[periodo]) for periodo in sorted(totais)], por_forma
+
+
+def _with_series(summary: dict, granularity: str) -> bool:
+    """
+    Define a granularidade efetiva da série. Devolve True se ela precisa da
+    query de série; por mês, a série já vem da query do dashboard.
+    """
+    summary['granularity'] = effective_granularity(granularity, summary['meses_selecionados'])
+    if summary['granularity'] == 'month':
+        summary['serie'] = summary['meses_selecionados']
+        summary['serie_forma_pagamento'] = summary['forma_pagamento']
+        return False
+    return True
+
+
+async def fetch_dashboard_aggregates_async(
+    db_session, user_id: int, months: list = None, id_historico: int = None, granularity: str = 'month'
+) -> dict:
+    result = await db_session.execute(build_dashboard_query(user_id, months, id_historico))
+    summary = summarize_dashboard_rows(result.all())
+    if _with_series(summary, granularity):
+        stmt = build_series_query(user_id, summary['granularity'], months, id_historico)
+        result = await db_session.execute(stmt)
+        summary['serie'], summary['serie_forma_pagamento'] = summarize_series_rows(result.all())
+    return summary
@@ -0,0 +1,120 @@
+"""
+Exportação das vendas do usuário em Parquet, Arrow IPC (stream) ou CSV.
+
+As linhas saem do banco por um cursor no servidor em lotes de
+EXPORT_BATCH_SIZE; cada lote vira um RecordBatch do Arrow, é gravado no
+writer do formato e os bytes produzidos são enviados na hora. A memória
+usada depende do tamanho do lote, não do número de vendas.
+"""
+import asyncio
+from os import getenv
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from sqlalchemy import and_, select
+from app.filters import planilha_filters
+from database.models import PlanilhaModel
+from database.replicas import replica_router
+
+
+EXPORT_BATCH_SIZE = int(getenv('EXPORT_BATCH_SIZE', 10000))
+
+EXPORT_MEDIA_TYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+EXPORT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('data_venda', pa.date32()),
+    ('data_pagamento', pa.date32()),
+    ('valor_bruto', pa.float64()),
+    ('valor_liquido', pa.float64()),
+    ('taxa', pa.float64()),
+    ('forma_pagamento', pa.string()),
+    ('nome_produto', pa.string()),
+    ('categoria_produto', pa.string()),
+    ('historic_dashboard_id', pa.int64()),
+])
+
+
+def export_select(filters: list):
+    return (
+        select(*(getattr(PlanilhaModel, name) for name in EXPORT_SCHEMA.names))
+        .where(and_(*filters))
+        .order_by(PlanilhaModel.data_venda, PlanilhaModel.id)
+    )
+
+
+class ChunkSink:
+    """
+    Arquivo só de escrita que acumula o que o writer do Arrow gravou até o
+    próximo `drain()`.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _open_writer(file_format: str, sink: ChunkSink):
+    if file_format == 'parquet':
+        return pq.ParquetWriter(sink, EXPORT_SCHEMA, compression='zstd')
+    if file_format == 'arrow':
+        return pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+    return pa_csv.CSVWriter(sink, EXPORT_SCHEMA)
+
+
+def _record_batch(rows: list) -> pa.RecordBatch:
+    columns = list(zip(*rows))
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, EXPORT_SCHEMA)],
+        schema=EXPORT_SCHEMA
+    )
+
+
+def _write_rows(writer, rows: list):
+    writer.write_batch(_record_batch(rows))
+
+
+async def iter_export(user_id: int, date_selected: list, id_historico: int, file_format: str):
+    """
+    Gera o arquivo de exportação em pedaços de bytes. A conversão e a
+    compressão de cada lote rodam numa thread para não travar o event loop.
+
+    Abre a própria sessão: o gerador é consumido depois que as dependências
+    da rota já foram finalizadas.
+    """
+    stmt = export_select(planilha_filters(user_id, date_selected, id_historico))
+    sink = ChunkSink()
+    writer = _open_writer(file_format, sink)
+
+    async with await replica_router.session(user_id) as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            await asyncio.to_thread(_write_rows, writer, rows)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+    # Fecha o writer mesmo sem vendas: Parquet e Arrow precisam do schema/rodapé
+    writer.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
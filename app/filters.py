@@ -0,0 +1,45 @@
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+from database.models import PlanilhaModel
+
+
+def parse_months(date_selected: list) -> list:
+    # "MM/YYYY" -> primeiro dia do mês
+    return sorted({datetime.strptime(value, "%m/%Y").date() for value in date_selected or []})
+
+
+def next_month(month: date) -> date:
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def month_ranges(months: list) -> list:
+    """
+    Converte os meses selecionados em intervalos [início, fim), juntando
+    meses consecutivos: jan, fev e abr/2024 -> [01/01, 01/03) e [01/04, 01/05).
+    """
+    ranges = []
+    for month in sorted(set(months)):
+        if ranges and ranges[-1][1] == month:
+            ranges[-1] = (ranges[-1][0], next_month(month))
+        else:
+            ranges.append((month, next_month(month)))
+    return ranges
+
+
+def month_filter(column, months: list):
+    # Comparações simples na coluna para o PostgreSQL poder usar o índice
+    return or_(*(and_(column >= start, column < end) for start, end in month_ranges(months)))
+
+
+def planilha_filters(user_id: int, date_selected: list = None, id_historico: int = None) -> list:
+    filters = [PlanilhaModel.user_id == user_id]
+
+    if date_selected:
+        filters.append(month_filter(PlanilhaModel.data_venda, parse_months(date_selected)))
+
+    if id_historico:
+        filters.append(PlanilhaModel.historic_dashboard_id == id_historico)
+
+    return filters
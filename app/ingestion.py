@@ -0,0 +1,342 @@
+import csv
+import hashlib
+import io
+from datetime import date, datetime
+from itertools import islice
+from os import getenv
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+from sqlalchemy import and_, func, select
+from database.bulk import insert_planilhas
+from database.models import HistoricDashboard, PlanilhaModel
+
+
+UPLOAD_CHUNK_SIZE = int(getenv('UPLOAD_CHUNK_SIZE', 5000))
+
+# Linhas de cabeçalho do relatório antes da linha com os nomes das colunas
+HEADER_ROWS = 11
+
+COLUMNS = {
+    'NOME DO PRODUTO': 'nome_produto',
+    'DATA DE VENDA (DIA-MÊS-ANO)': 'data_venda',
+    'DATA DO PAGAMENTO (DIA-MÊS-ANO)': 'data_pagamento',
+    'VALOR BRUTO (R$)': 'valor_bruto',
+    'VALOR LIQUIDO (R$)': 'valor_liquido',
+    'TAXA (R$)': 'taxa',
+    'FORMA DE PAGAMENTO': 'forma_pagamento',
+    'CATEGORIA': 'categoria_produto'
+}
+
+DATE_COLUMNS = ('data_venda', 'data_pagamento')
+FLOAT_COLUMNS = ('valor_bruto', 'valor_liquido', 'taxa')
+
+# Linhas por lote no Parquet e bytes por bloco no CSV
+UPLOAD_READ_BATCH_SIZE = int(getenv('UPLOAD_READ_BATCH_SIZE', 10000))
+CSV_BLOCK_SIZE = 1 << 20
+
+# Bytes do início do CSV usados para achar o cabeçalho e o separador
+CSV_SAMPLE_SIZE = 64 * 1024
+CSV_DELIMITERS = (';', ',', '\t')
+
+XLSX_MAGIC = b'PK\x03\x04'
+PARQUET_MAGIC = b'PAR1'
+
+
+def detect_format(file) -> str:
+    # Pelo conteúdo, não pela extensão: XLSX é um zip e Parquet começa com PAR1
+    start = file.read(4)
+    file.seek(0)
+    if start == XLSX_MAGIC:
+        return 'xlsx'
+    if start == PARQUET_MAGIC:
+        return 'parquet'
+    return 'csv'
+
+
+def iter_upload_rows(file, sheet_name: str = None):
+    """
+    Lê a planilha enviada (XLSX, CSV ou Parquet, detectado pelo conteúdo) e
+    devolve um dicionário por linha com os campos de PlanilhaModel, igual
+    para os três formatos. `sheet_name` escolhe a aba do XLSX (padrão: a primeira).
+    """
+    file_format = detect_format(file)
+    if file_format == 'parquet':
+        return iter_parquet_rows(file)
+    if file_format == 'csv':
+        return iter_csv_rows(file)
+    return iter_xlsx_rows(file, sheet_name=sheet_name)
+
+
+def upload_sheets(data: bytes) -> list:
+    # Abas de um XLSX (cada uma vira um histórico); [None] para CSV e Parquet
+    file = io.BytesIO(data)
+    if detect_format(file) != 'xlsx':
+        return [None]
+    workbook = load_workbook(file, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def parse_upload(data: bytes, user_id: int, sheet_name: str = None) -> list:
+    """
+    Lê e normaliza uma planilha (ou uma aba) inteira, sem historic_dashboard_id.
+    Roda nos processos de parsing dos uploads em lote: recebe e devolve só
+    dados serializáveis.
+    """
+    fingerprints = RowFingerprints()
+    return [
+        fingerprints.add(normalize_row(row, user_id, None))
+        for row in iter_upload_rows(io.BytesIO(data), sheet_name=sheet_name)
+    ]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_uploaded(db_session, user_id: int, digest: str):
+    """
+    Se o usuário já gravou um arquivo com este conteúdo, devolve
+    (id do primeiro histórico, vendas gravadas); senão, None.
+    """
+    historic_id, rows = db_session.execute(
+        select(func.min(HistoricDashboard.id), func.count(PlanilhaModel.id))
+        .select_from(HistoricDashboard)
+        .outerjoin(
+            PlanilhaModel,
+            and_(
+                PlanilhaModel.user_id == user_id,
+                PlanilhaModel.historic_dashboard_id == HistoricDashboard.id
+            )
+        )
+        .where(HistoricDashboard.user_id == user_id, HistoricDashboard.content_hash == digest)
+    ).one()
+    return None if historic_id is None else (historic_id, rows)
+
+
+def iter_xlsx_rows(file, skip_rows: int = HEADER_ROWS, sheet_name: str = None):
+    """
+    Lê a planilha linha a linha (openpyxl read-only), sem carregar o
+    arquivo inteiro. Devolve um dicionário por linha, com as colunas já
+    renomeadas para os campos de PlanilhaModel.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        # Sem sheet_name, a primeira aba (como o pd.read_excel), não a aba ativa
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        rows = sheet.iter_rows(min_row=skip_rows + 1, values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        positions = _column_positions(header)
+
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            yield {field: values[index] if index < len(values) else None for field, index in positions.items()}
+    finally:
+        workbook.close()
+
+
+def _find_csv_header(file) -> tuple:
+    """
+    Procura, no começo do arquivo, a linha com os nomes das colunas (pode
+    haver linhas de relatório antes dela) e o separador usado.
+    Devolve (índice da linha, nomes das colunas, separador, encoding).
+    """
+    sample = file.read(CSV_SAMPLE_SIZE)
+    file.seek(0)
+
+    try:
+        text, encoding = sample.decode('utf-8-sig'), 'utf8'
+    except UnicodeDecodeError as e:
+        # A amostra pode ter cortado um caractere de vários bytes no final
+        if e.start < len(sample) - 3:
+            text, encoding = sample.decode('latin-1'), 'latin1'
+        else:
+            text, encoding = sample[:e.start].decode('utf-8-sig'), 'utf8'
+
+    for index, line in enumerate(text.splitlines()[:HEADER_ROWS + 1]):
+        for delimiter in CSV_DELIMITERS:
+            names = [name.strip() for name in next(csv.reader([line], delimiter=delimiter), [])]
+            if all(column in names for column in COLUMNS):
+                return index, names, delimiter, encoding
+
+    raise ValueError(f"Colunas ausentes na planilha: {', '.join(COLUMNS)}")
+
+
+def iter_csv_rows(file):
+    """
+    Lê o CSV com o leitor do Arrow (multithread, em lotes), sem carregar o
+    arquivo inteiro. Com separador `;` os valores usam vírgula decimal.
+    As datas (DD-MM-YYYY, como no XLSX) já são convertidas pelo Arrow.
+    """
+    header_index, names, delimiter, encoding = _find_csv_header(file)
+
+    column_types = {column: pa.string() for column in COLUMNS}
+    column_types.update({column: pa.float64() for column, field in COLUMNS.items() if field in FLOAT_COLUMNS})
+    column_types.update({column: pa.timestamp('s') for column, field in COLUMNS.items() if field in DATE_COLUMNS})
+
+    reader = pa_csv.open_csv(
+        file,
+        read_options=pa_csv.ReadOptions(
+            skip_rows=header_index + 1,
+            column_names=names,
+            encoding=encoding,
+            block_size=CSV_BLOCK_SIZE
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=list(COLUMNS),
+            column_types=column_types,
+            decimal_point=',' if delimiter == ';' else '.',
+            timestamp_parsers=['%d-%m-%Y'],
+            strings_can_be_null=True
+        )
+    )
+
+    for batch in reader:
+        yield from _batch_rows(_timestamps_to_dates(batch))
+
+
+def _timestamps_to_dates(batch: pa.RecordBatch) -> pa.RecordBatch:
+    columns = [
+        column.cast(pa.date32()) if pa.types.is_timestamp(column.type) else column
+        for column in batch.columns
+    ]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def iter_parquet_rows(file, batch_size: int = UPLOAD_READ_BATCH_SIZE):
+    parquet_file = pq.ParquetFile(file)
+    names = [name.strip() for name in parquet_file.schema_arrow.names]
+    missing = [column for column in COLUMNS if column not in names]
+    if missing:
+        raise ValueError(f"Colunas ausentes na planilha: {', '.join(missing)}")
+
+    columns = [parquet_file.schema_arrow.names[names.index(column)] for column in COLUMNS]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from _batch_rows(batch.rename_columns(list(COLUMNS)))
+
+
+def _batch_rows(batch: pa.RecordBatch):
+    for record in batch.to_pylist():
+        if all(value is None or value == '' for value in record.values()):
+            continue
+        yield {field: record[column] for column, field in COLUMNS.items()}
+
+
+def _column_positions(header) -> dict:
+    names = [str(name).strip() if name is not None else None for name in header]
+    missing = [column for column in COLUMNS if column not in names]
+    if missing:
+        raise ValueError(f"Colunas ausentes na planilha: {', '.join(missing)}")
+    return {field: names.index(column) for column, field in COLUMNS.items()}
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip(), '%d-%m-%Y').date()
+
+
+def normalize_row(row: dict, user_id: int, historic_dashboard_id: int) -> dict:
+    for field in DATE_COLUMNS:
+        row[field] = _parse_date(row[field])
+    for field in FLOAT_COLUMNS:
+        row[field] = float(row[field])
+    row['user_id'] = user_id
+    row['historic_dashboard_id'] = historic_dashboard_id
+    return row
+
+
+def _fingerprint_number(value: float) -> str:
+    # -0.0 e 0.0 dão o mesmo texto: o sinal do zero se perde ao gravar no
+    # banco, e o backfill da migração b5d19e7c3a48 lê os valores de lá
+    text = f'{value:.6f}'
+    return '0.000000' if text == '-0.000000' else text
+
+
+def row_fingerprint(row: dict, occurrence: int) -> str:
+    """
+    md5 das colunas de negócio da venda e de `occurrence`, a ordem dela
+    entre as vendas idênticas do mesmo arquivo (vendas repetidas de
+    verdade continuam entrando). A migração b5d19e7c3a48 usa esta função
+    (por RowFingerprints) para as vendas antigas.
+    """
+    key = '|'.join((
+        row['data_venda'].isoformat(),
+        row['data_pagamento'].isoformat(),
+        *(_fingerprint_number(row[field]) for field in FLOAT_COLUMNS),
+        str(row['forma_pagamento']),
+        str(row['nome_produto']),
+        str(row['categoria_produto']),
+        str(occurrence)
+    ))
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+class RowFingerprints:
+    """
+    Preenche o `fingerprint` das vendas de um arquivo, contando as
+    repetições. Guarda um digest por venda distinta do arquivo.
+    """
+
+    def __init__(self):
+        self._occurrences = {}
+
+    def add(self, row: dict) -> dict:
+        base = row_fingerprint(row, 0)
+        occurrence = self._occurrences.get(base, 0) + 1
+        self._occurrences[base] = occurrence
+        row['fingerprint'] = row_fingerprint(row, occurrence)
+        return row
+
+
+def iter_chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def ingest_rows(
+    db_session,
+    rows,
+    user_id: int,
+    historic_dashboard_id: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    on_progress=None,
+    normalized: bool = False
+) -> tuple:
+    """
+    Valida, converte e insere as linhas em blocos de `chunk_size`: cada bloco
+    é enviado ao banco (COPY no PostgreSQL) antes de o próximo ser lido, então
+    a memória usada pelas vendas não depende do tamanho do arquivo. Vendas que
+    o usuário já tem (mesmo fingerprint) são ignoradas. O commit fica a cargo
+    de quem chama.
+
+    `on_progress(rows_parsed, rows_inserted)` é chamado depois de cada bloco.
+    Com `normalized=True` as linhas já vêm de parse_upload e só recebem o
+    historic_dashboard_id. Devolve (linhas lidas, linhas inseridas).
+    """
+    fingerprints = RowFingerprints()
+    parsed = 0
+    total = 0
+    for chunk in iter_chunks(rows, chunk_size):
+        if normalized:
+            for row in chunk:
+                row['historic_dashboard_id'] = historic_dashboard_id
+        else:
+            chunk = [fingerprints.add(normalize_row(row, user_id, historic_dashboard_id)) for row in chunk]
+        parsed += len(chunk)
+        total += insert_planilhas(db_session, chunk)
+        if on_progress is not None:
+            on_progress(parsed, total)
+    return parsed, total
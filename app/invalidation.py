@@ -0,0 +1,61 @@
+"""
+Invalidação do cache de respostas e pin de leitura no primário depois de
+uma escrita do usuário.
+
+As escritas feitas pela API chamam user_data_changed direto. As dos
+workers de upload chegam por LISTEN (database.notifications): cada
+processo da API mantém uma conexão escutando o canal. Se ela cair, as
+mensagens do intervalo se perdem; por isso, a cada (re)conexão o cache
+inteiro é descartado.
+"""
+import asyncio
+import logging
+from os import getenv
+import asyncpg
+from sqlalchemy.engine import make_url
+from app.cache import response_cache
+from database.connection import DATABASE_URL
+from database.notifications import USER_DATA_CHANNEL
+from database.replicas import replica_router
+
+
+USER_DATA_LISTEN_RETRY = float(getenv('USER_DATA_LISTEN_RETRY', 5))
+
+logger = logging.getLogger(__name__)
+
+
+def user_data_changed(user_id: int):
+    # Descarta as respostas em cache do usuário e manda as próximas leituras
+    # dele ao primário (réplicas podem estar atrasadas)
+    response_cache.invalidate_user(user_id)
+    replica_router.pin(user_id)
+
+
+def _on_notification(connection, pid, channel, payload):
+    user_data_changed(int(payload))
+
+
+async def listen_user_data_changes(url: str = DATABASE_URL):
+    """
+    Escuta USER_DATA_CHANNEL até ser cancelada, reconectando a cada
+    USER_DATA_LISTEN_RETRY segundos se a conexão cair.
+    """
+    dsn = make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+        except (OSError, asyncpg.PostgresError) as e:
+            logger.warning('LISTEN %s indisponível: %s', USER_DATA_CHANNEL, e)
+            await asyncio.sleep(USER_DATA_LISTEN_RETRY)
+            continue
+
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _: closed.set())
+        try:
+            await connection.add_listener(USER_DATA_CHANNEL, _on_notification)
+            response_cache.clear()
+            await closed.wait()
+            logger.warning('Conexão do LISTEN %s caiu; reconectando', USER_DATA_CHANNEL)
+        finally:
+            if not connection.is_closed():
+                await connection.close()
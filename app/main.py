@@ -1,8 +1,22 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import user_router, planilha_router, dashboard_router, historico_router
+from app.invalidation import listen_user_data_changes
+from app.metrics import MetricsMiddleware
+from app.routes import user_router, planilha_router, dashboard_router, historico_router, internal_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Uploads terminados pelos workers invalidam o cache deste processo
+    listener = asyncio.create_task(listen_user_data_changes())
+    yield
+    listener.cancel()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 origins = [
     "https://ui-6kpo.onrender.com",
@@ -15,8 +29,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Query-Count"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 @app.get('/')
 def health_check():
     return "Ok, it's working"
@@ -24,4 +41,5 @@ def health_check():
 app.include_router(user_router)
 app.include_router(planilha_router)
 app.include_router(dashboard_router)
-app.include_router(historico_router)
\ No newline at end of file
+app.include_router(historico_router)
+app.include_router(internal_router)
@@ -0,0 +1,200 @@
+"""
+Métricas por rota: latência, queries SQL, tempo no banco e linhas devolvidas.
+
+MetricsMiddleware mede cada requisição HTTP e abre um count_queries() em
+volta dela, de modo que as queries feitas pela rota (em async ou no
+threadpool) entram na conta. O resultado sai:
+
+- no header `Server-Timing` da resposta (db, app e total, em ms);
+- em GET /internal/metrics, no formato texto do Prometheus.
+"""
+import threading
+import time
+from bisect import bisect_left
+from starlette.datastructures import MutableHeaders
+from app.admission import admission_limiters
+from database.instrumentation import count_queries
+from database.pool import pool_stats
+
+
+# Limites (em segundos) dos buckets do histograma de latência por rota
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.requests = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.sql_rows = 0
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float, queries):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+
+            metrics.requests[status_code] = metrics.requests.get(status_code, 0) + 1
+            metrics.latency_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.latency_sum += seconds
+            metrics.latency_count += 1
+            metrics.sql_queries += queries.count
+            metrics.sql_seconds += queries.duration
+            metrics.sql_rows += queries.rows
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                '# HELP http_requests_total Requisições HTTP por rota e status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (method, route), metrics in routes:
+                for status_code, count in sorted(metrics.requests.items()):
+                    lines.append(f'http_requests_total{_labels(method=method, route=route, status=status_code)} {count}')
+
+            lines += [
+                '# HELP http_request_duration_seconds Latência das requisições HTTP por rota.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (method, route), metrics in routes:
+                total = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), metrics.latency_buckets):
+                    total += count
+                    lines.append(
+                        f'http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {total}'
+                    )
+                labels = _labels(method=method, route=route)
+                lines.append(f'http_request_duration_seconds_sum{labels} {metrics.latency_sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{labels} {metrics.latency_count}')
+
+            for name, attribute, help_text in (
+                ('sql_queries_total', 'sql_queries', 'Queries SQL executadas pelas requisições da rota.'),
+                ('sql_duration_seconds_total', 'sql_seconds', 'Tempo gasto no banco pelas requisições da rota.'),
+                ('sql_rows_total', 'sql_rows', 'Linhas devolvidas pelo banco às requisições da rota.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (method, route), metrics in routes:
+                    value = getattr(metrics, attribute)
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{_labels(method=method, route=route)} {value}')
+
+        lines += _render_pools()
+        lines += _render_admission()
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _render_pools() -> list:
+    snapshots = {name: stats.snapshot() for name, stats in sorted(pool_stats.items())}
+    lines = []
+    for name, key, kind, help_text in (
+        ('db_pool_checked_out', 'checked_out', 'gauge', 'Conexões em uso.'),
+        ('db_pool_idle', 'idle', 'gauge', 'Conexões paradas no pool.'),
+        ('db_pool_overflow', 'overflow', 'gauge', 'Conexões abertas além de pool_size.'),
+        ('db_pool_timeouts_total', 'timeouts', 'counter', 'Checkouts que estouraram o pool_timeout.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for pool, snapshot in snapshots.items():
+            lines.append(f'{name}{_labels(pool=pool)} {snapshot[key]}')
+    return lines
+
+
+def _render_admission() -> list:
+    snapshots = {name: limiter.snapshot() for name, limiter in sorted(admission_limiters.items())}
+    lines = []
+    for name, key, kind, help_text in (
+        ('admission_active', 'active', 'gauge', 'Requisições com vaga, em andamento.'),
+        ('admission_queue_depth', 'waiting', 'gauge', 'Requisições esperando vaga.'),
+        ('admission_admitted_total', 'admitted', 'counter', 'Requisições admitidas.'),
+        ('admission_queued_total', 'queued', 'counter', 'Requisições que passaram pela fila.'),
+        ('admission_wait_seconds_total', 'wait_seconds', 'counter', 'Tempo total de espera na fila.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for limiter, snapshot in snapshots.items():
+            lines.append(f'{name}{_labels(limiter=limiter)} {snapshot[key]}')
+
+    lines += [
+        '# HELP admission_rejected_total Requisições recusadas (user = limite do usuário, queue = fila cheia, timeout = espera estourada).',
+        '# TYPE admission_rejected_total counter',
+    ]
+    for limiter, snapshot in snapshots.items():
+        for reason, count in sorted(snapshot['rejected'].items()):
+            lines.append(f'admission_rejected_total{_labels(limiter=limiter, reason=reason)} {count}')
+    return lines
+
+
+def server_timing(queries, total: float) -> str:
+    db = queries.duration * 1000
+    total = total * 1000
+    return (
+        f'db;dur={db:.1f};desc="{queries.count} queries, {queries.rows} rows", '
+        f'app;dur={max(total - db, 0):.1f}, '
+        f'total;dur={total:.1f}'
+    )
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sem BaseHTTPMiddleware) para não bufferizar as
+    respostas em streaming. A latência registrada vai até o fim do corpo;
+    o Server-Timing, enviado com os headers, cobre até o início da resposta.
+    """
+
+    def __init__(self, app, registry: RequestMetrics = request_metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        with count_queries() as queries:
+            async def send_with_timing(message):
+                nonlocal status_code
+                if message['type'] == 'http.response.start':
+                    status_code = message['status']
+                    headers = MutableHeaders(scope=message)
+                    headers.append('Server-Timing', server_timing(queries, time.perf_counter() - start))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                # Rotas não encontradas ficam todas em "unmatched" (evita um label por URL)
+                route = scope.get('route')
+                self.registry.observe(
+                    scope['method'],
+                    route.path if route is not None else 'unmatched',
+                    status_code,
+                    time.perf_counter() - start,
+                    queries
+                )
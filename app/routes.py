@@ -1,26 +1,49 @@
 import pytz
-import os
-import pandas as pd
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
-from jose import JWTError
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.schemas import LoginRequest, PlanilhaCreate, User, UpdateVendaRequest
-from app.depends import format_currency, get_current_user, get_data_dashboard, get_db_session
+from app.schemas import LoginRequest, PlanilhaCreate, User, UpdateVendaRequest, UpdateVendasBatchRequest
+from app.depends import (
+    get_async_db_session,
+    get_current_user,
+    get_current_user_async,
+    get_data_dashboard_async,
+    get_data_planilha_async,
+    get_db_session,
+    get_read_db_session,
+    internal_access,
+    iter_planilha_ndjson,
+    UPDATE_BATCH_MAX_ITEMS,
+    UPLOAD_BATCH_MAX_FILES
+)
+from app.admission import admission, admission_limiters
 from app.auth_user import UserUseCases
-from fastapi.responses import JSONResponse
+from app.cache import cached_json_response_async, response_cache
+from app.export import EXPORT_MEDIA_TYPES, iter_export
+from app.filters import parse_months
+from app.ingestion import content_hash, find_uploaded
+from app.invalidation import user_data_changed
+from app.metrics import PROMETHEUS_CONTENT_TYPE, request_metrics
+from app.updates import apply_update, delete_historic, items_update, matching_update
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from app.depends import oauth_scheme
-from jose import jwt
-from sqlalchemy import and_, func
 from typing import List
 
-from database.models import HistoricDashboard, PlanilhaModel, UserModel
+from database.instrumentation import count_queries
+from database.models import HistoricDashboard, PlanilhaModel, UploadJob, UploadJobFile
+from database.pool import pool_stats
+from database.replicas import replica_router
+from database.rollup import apply_rollup_delta
 
 
 user_router = APIRouter(prefix='/auth')
 planilha_router = APIRouter(prefix='/planilha')
 dashboard_router = APIRouter(prefix='/dashboard')
 historico_router = APIRouter(prefix='/historico')
+# Estatísticas do processo: só para a rede interna ou com o token (internal_access)
+internal_router = APIRouter(prefix='/internal', dependencies=[Depends(internal_access)])
 
 
 @user_router.post('/register')
@@ -30,7 +53,7 @@ def user_register(
 ):
     uc = UserUseCases(db_session=db_session)
     uc.user_register(user=user)
-    return JSONResponse(
+    return ORJSONResponse(
         content={"message": "User created"},
         status_code=status.HTTP_201_CREATED
     )
@@ -51,39 +74,21 @@ def user_login(
 
     auth_data = uc.user_login(user=user)
 
-    return JSONResponse(
+    return ORJSONResponse(
         content=auth_data,
         status_code=status.HTTP_200_OK
     )
 
 
 @user_router.get('/detail')
-def get_current_user_details(
+async def get_current_user_details(
     token: str = Depends(oauth_scheme),
-    db_session: Session = Depends(get_db_session)
+    db_session: AsyncSession = Depends(get_async_db_session)
 ):
-    # Exceção padrão para erros de autenticação
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        # Decodifica o token JWT usando a chave secreta e algoritmo
-        payload = jwt.decode(token, os.getenv("SECRET_KEY"), algorithms=[os.getenv("ALGORITHM")])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    # Verifica se o usuário existe no banco de dados
-    user = db_session.query(UserModel).filter(UserModel.username == username).first()
-    if user is None:
-        raise credentials_exception
+    user = await get_current_user_async(token=token, db=db_session)
 
     # Retorna o nome do usuário logado
-    return JSONResponse(content={"username": user.username}, status_code=status.HTTP_200_OK)
+    return ORJSONResponse(content={"username": user.username}, status_code=status.HTTP_200_OK)
 
 
 @planilha_router.post('/register')
@@ -108,15 +113,18 @@ def create_planilha(
     )
 
     db_session.add(nova_planilha)
+    db_session.flush()
+    apply_rollup_delta(db_session, user.id, PlanilhaModel.id == nova_planilha.id)
     db_session.commit()
+    user_data_changed(user.id)
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={"message": "Dados inseridos com sucesso!"},
         status_code=status.HTTP_200_OK
     )
 
 
-@planilha_router.put('/upload')
+@planilha_router.put('/upload', dependencies=[Depends(admission('upload'))])
 def create_planilha(
     selected_file: UploadFile = File(...),
     token: str = Depends(oauth_scheme),
@@ -125,179 +133,221 @@ def create_planilha(
     
     user = get_current_user(token=token, db=db_session)
 
+    arquivo = selected_file.file.read()
+
+    # Arquivo já enviado pelo usuário: nada a processar
+    uploaded = find_uploaded(db_session, user.id, content_hash(arquivo))
+    if uploaded is not None:
+        historic_id, rows = uploaded
+        return ORJSONResponse(
+            content={
+                "message": "Planilha já enviada",
+                "job_id": None,
+                "id_historico": historic_id,
+                "rows_skipped": rows
+            },
+            status_code=status.HTTP_200_OK
+        )
+
     brasilia_tz = pytz.timezone('America/Sao_Paulo')
     now_in_brasilia = datetime.now(brasilia_tz).replace(tzinfo=None)  
 
-    historic = HistoricDashboard(
+    # O processamento fica com os workers (app.worker); o histórico só
+    # aparece quando as vendas forem gravadas
+    job = UploadJob(
         user_id=user.id,
+        filename=selected_file.filename,
+        arquivo=arquivo,
         data_upload_planilha=now_in_brasilia
     )
 
-    db_session.add(historic)
+    db_session.add(job)
     db_session.commit()
-    
-    try:
-        # Exel -> DataFrame
-        df = pd.read_excel(selected_file.file, skiprows=range(0, 11))
-
-        # Coverter datas para o formato correto
-        df['DATA DE VENDA (DIA-MÊS-ANO)'] = pd.to_datetime(df['DATA DE VENDA (DIA-MÊS-ANO)'], format='%d-%m-%Y')
-        df['DATA DO PAGAMENTO (DIA-MÊS-ANO)'] = pd.to_datetime(df['DATA DO PAGAMENTO (DIA-MÊS-ANO)'], format='%d-%m-%Y')
-
-        # Renomear colunas para facilitar
-        df.rename(columns={
-            'NOME DO PRODUTO': 'nome_produto',
-            'DATA DE VENDA (DIA-MÊS-ANO)': 'data_venda',
-            'DATA DO PAGAMENTO (DIA-MÊS-ANO)': 'data_pagamento',
-            'VALOR BRUTO (R$)': 'valor_bruto',
-            'VALOR LIQUIDO (R$)': 'valor_liquido',
-            'TAXA (R$)': 'taxa',
-            'FORMA DE PAGAMENTO': 'forma_pagamento',
-            'CATEGORIA': 'categoria_produto'
-        }, inplace=True)
-
-        df['user_id'] = user.id
-        df['historic_dashboard_id'] = historic.id
-
-        # Converter o DataFrame em uma lista de dicionários
-        data_to_insert = df.to_dict(orient='records')
-
-        # Criar um objeto para cada linha
-        novas_planilhas = [PlanilhaModel(**row) for row in data_to_insert]
-
-        # Inserção em lote (maior performance)
-        db_session.bulk_save_objects(novas_planilhas)
-        db_session.commit()
-    except Exception as e:
-        return JSONResponse(content=str(e), status_code=status.HTTP_400_BAD_REQUEST)
-
-    return JSONResponse(
-        content={"message": "Dados inseridos com sucesso!"},
-        status_code=status.HTTP_200_OK
+
+    return ORJSONResponse(
+        content={"message": "Planilha recebida, processando...", "job_id": job.id},
+        status_code=status.HTTP_202_ACCEPTED
     )
 
 
-@dashboard_router.get('/detail')
-def get_dashboard_detail(
-    date_selected: List[str] = Query(None, alias="date_selected[]"),
-    id_historico: int = Query(None, alias="id_historico"),
+@planilha_router.put('/upload/batch', dependencies=[Depends(admission('upload'))])
+def create_planilha_batch(
+    selected_files: List[UploadFile] = File(...),
     token: str = Depends(oauth_scheme),
     db_session: Session = Depends(get_db_session)
-):  
+):
 
     user = get_current_user(token=token, db=db_session)
 
-    filters = [PlanilhaModel.user_id==user.id]
-    if date_selected:
-        filter_date = [datetime.strptime(date, "%m/%Y") for date in date_selected]
-        filter_date.sort()
-        filters.append(
-            func.extract('year', PlanilhaModel.data_venda).in_([date.year for date in filter_date]) &
-            func.extract('month', PlanilhaModel.data_venda).in_([date.month for date in filter_date])
+    if len(selected_files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Too many files (max {UPLOAD_BATCH_MAX_FILES})'
         )
 
-    if id_historico:
-        filters.append(PlanilhaModel.historic_dashboard_id == id_historico)
-    
-    planilhas = db_session.query(PlanilhaModel).filter(and_(*filters)).order_by(PlanilhaModel.data_venda).all()
+    # Arquivos já enviados pelo usuário ficam de fora do job
+    files = []
+    skipped_files = []
+    for file in selected_files:
+        arquivo = file.file.read()
+        uploaded = find_uploaded(db_session, user.id, content_hash(arquivo))
+        if uploaded is None:
+            files.append(UploadJobFile(position=len(files), filename=file.filename, arquivo=arquivo))
+        else:
+            historic_id, rows = uploaded
+            skipped_files.append({"filename": file.filename, "id_historico": historic_id, "rows_skipped": rows})
 
-    data = get_data_dashboard(planilhas, user, db_session, filters)
+    if not files:
+        return ORJSONResponse(
+            content={"message": "Planilhas já enviadas", "job_id": None, "skipped_files": skipped_files},
+            status_code=status.HTTP_200_OK
+        )
 
-    return JSONResponse(
-        content=data,
+    brasilia_tz = pytz.timezone('America/Sao_Paulo')
+    now_in_brasilia = datetime.now(brasilia_tz).replace(tzinfo=None)
+
+    # Cada arquivo (ou aba de XLSX) vira um histórico; o worker grava todos juntos
+    job = UploadJob(
+        user_id=user.id,
+        data_upload_planilha=now_in_brasilia,
+        files=files
+    )
+
+    db_session.add(job)
+    db_session.commit()
+
+    return ORJSONResponse(
+        content={"message": "Planilhas recebidas, processando...", "job_id": job.id, "skipped_files": skipped_files},
+        status_code=status.HTTP_202_ACCEPTED
+    )
+
+
+@planilha_router.get('/upload/{job_id}')
+def get_upload_status(
+    job_id: int,
+    token: str = Depends(oauth_scheme),
+    db_session: Session = Depends(get_db_session)
+):
+
+    user = get_current_user(token=token, db=db_session)
+
+    job = db_session.query(UploadJob).filter(
+        UploadJob.id == job_id,
+        UploadJob.user_id == user.id
+    ).first()
+
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Upload not found'
+        )
+
+    return ORJSONResponse(
+        content={
+            "job_id": job.id,
+            "status": job.status,
+            "rows_parsed": job.rows_parsed,
+            "rows_inserted": job.rows_inserted,
+            "rows_skipped": job.rows_skipped,
+            "errors": job.errors,
+            "id_historico": job.historic_dashboard_id,
+            "parts": job.parts
+        },
         status_code=status.HTTP_200_OK
     )
 
 
+@dashboard_router.get('/detail')
+async def get_dashboard_detail(
+    request: Request,
+    date_selected: List[str] = Query(None, alias="date_selected[]"),
+    id_historico: int = Query(None, alias="id_historico"),
+    granularity: str = Query('month', pattern='^(day|week|month|quarter|year)$'),
+    token: str = Depends(oauth_scheme),
+    db_session: AsyncSession = Depends(get_read_db_session)
+):  
+
+    user = await get_current_user_async(token=token, db=db_session)
+
+    cache_key = response_cache.make_key('dashboard_detail', user.id, date_selected, id_historico, granularity=granularity)
+
+    with count_queries() as query_counter:
+        response = await cached_json_response_async(
+            request,
+            cache_key,
+            lambda: get_data_dashboard_async(user, db_session, parse_months(date_selected), id_historico, granularity),
+            limiter=admission_limiters['dashboard']
+        )
+
+    response.headers["X-Query-Count"] = str(query_counter.count)
+    return response
+
+
 @planilha_router.get('/detail')
-def get_planilha_detail(
+async def get_planilha_detail(
+    request: Request,
     date_selected: List[str] = Query(None, alias="date_selected[]"),
     id_historico: int = Query(None, alias="id_historico"),
+    limit: int = Query(None, ge=1),
+    cursor: str = Query(None),
+    stream: bool = Query(False),
+    output_format: str = Query('formatted', alias="format", pattern='^(formatted|raw)$'),
     token: str = Depends(oauth_scheme),
-    db_session: Session = Depends(get_db_session)
+    db_session: AsyncSession = Depends(get_read_db_session)
 ):
 
-    user = get_current_user(token=token, db=db_session)
+    user = await get_current_user_async(token=token, db=db_session)
 
-    filters = [PlanilhaModel.user_id==user.id]
-    if date_selected:
-        filter_date = [datetime.strptime(date, "%m/%Y") for date in date_selected]
-        filter_date.sort()
-        filters.append(
-            func.extract('year', PlanilhaModel.data_venda).in_([date.year for date in filter_date]) &
-            func.extract('month', PlanilhaModel.data_venda).in_([date.month for date in filter_date])
-        )
+    # raw: valores numéricos e datas ISO, sem formatação
+    raw = output_format == 'raw'
 
-    if id_historico:
-        filters.append(PlanilhaModel.historic_dashboard_id == id_historico)
-
-    planilhas = (
-        db_session.query(
-            PlanilhaModel.id,
-            func.to_char(PlanilhaModel.data_venda, 'DD/MM/YYYY').label('data_venda'),
-            func.to_char(PlanilhaModel.data_pagamento, 'DD/MM/YYYY').label('data_pagamento'),
-            PlanilhaModel.valor_bruto,
-            PlanilhaModel.valor_liquido,
-            PlanilhaModel.taxa,
-            PlanilhaModel.forma_pagamento,
-            PlanilhaModel.nome_produto,
-            PlanilhaModel.categoria_produto,
-            PlanilhaModel.historic_dashboard_id
+    if stream:
+        return StreamingResponse(
+            iter_planilha_ndjson(user.id, date_selected, id_historico, raw),
+            media_type='application/x-ndjson'
         )
-        .filter(and_(*filters))
-        .order_by(PlanilhaModel.data_venda).all()
+
+    cache_key = response_cache.make_key(
+        'planilha_detail', user.id, date_selected, id_historico, limit=limit, cursor=cursor, raw=raw
     )
 
-    dates = db_session.query(func.date_trunc('month', PlanilhaModel.data_venda).label('month_year'))\
-        .filter(PlanilhaModel.user_id == user.id)\
-        .distinct()\
-        .order_by(func.date_trunc('month', PlanilhaModel.data_venda))\
-        .all()
-    dates_formatted = [
-        date[0].strftime("%m/%Y")
-        for date in dates
-    ]
+    return await cached_json_response_async(
+        request,
+        cache_key,
+        lambda: get_data_planilha_async(user, db_session, date_selected, id_historico, limit, cursor, raw)
+    )
 
-    formatted_rows = [
-        {
-            "id": row.id,
-            "data_venda": row.data_venda,
-            "data_pagamento": row.data_pagamento,
-            "valor_bruto": format_currency(row.valor_bruto),
-            "valor_liquido": format_currency(row.valor_liquido),
-            "taxa": format_currency(row.taxa),
-            "forma_pagamento": row.forma_pagamento,
-            "nome_produto": row.nome_produto,
-            "categoria_produto": row.categoria_produto,
-        }
-        for row in planilhas
-    ]
 
-    data = {
-        "planilhas": formatted_rows,
-        "dates": dates_formatted
-    }
+@planilha_router.get('/export')
+async def export_planilha(
+    date_selected: List[str] = Query(None, alias="date_selected[]"),
+    id_historico: int = Query(None, alias="id_historico"),
+    file_format: str = Query('parquet', alias="format", pattern='^(parquet|arrow|csv)$'),
+    token: str = Depends(oauth_scheme),
+    db_session: AsyncSession = Depends(get_read_db_session)
+):
+
+    user = await get_current_user_async(token=token, db=db_session)
 
-    if date_selected:
-        data['date_selected'] = list(dict.fromkeys(date.strftime("%m/%Y") for date in filter_date))
-    else:
-        data['date_selected'] = dates_formatted
+    extension = 'arrows' if file_format == 'arrow' else file_format
 
-    return JSONResponse(
-        content=data,
-        status_code=status.HTTP_200_OK
+    return StreamingResponse(
+        iter_export(user.id, date_selected, id_historico, file_format),
+        media_type=EXPORT_MEDIA_TYPES[file_format],
+        headers={'Content-Disposition': f'attachment; filename="vendas.{extension}"'}
     )
 
 
 @historico_router.get('/detail')
-def get_historico_detail(
+async def get_historico_detail(
     token: str = Depends(oauth_scheme),
-    db_session: Session = Depends(get_db_session)
+    db_session: AsyncSession = Depends(get_read_db_session)
 ):
 
-    user = get_current_user(token=token, db=db_session)
+    user = await get_current_user_async(token=token, db=db_session)
 
-    historico = db_session.query(HistoricDashboard).filter(HistoricDashboard.user_id == user.id).all()
+    result = await db_session.execute(select(HistoricDashboard).where(HistoricDashboard.user_id == user.id))
+    historico = result.scalars().all()
 
     data = [
         {
@@ -308,12 +358,42 @@ def get_historico_detail(
         for row in historico
     ]
 
-    return JSONResponse(
+    return ORJSONResponse(
         content=data,
         status_code=status.HTTP_200_OK
     )
 
 
+@historico_router.delete('/{historic_id}')
+def delete_historico(
+    historic_id: int,
+    token: str = Depends(oauth_scheme),
+    db_session: Session = Depends(get_db_session)
+):
+
+    user = get_current_user(token=token, db=db_session)
+
+    historic = db_session.query(HistoricDashboard).filter(
+        HistoricDashboard.id == historic_id,
+        HistoricDashboard.user_id == user.id
+    ).with_for_update().first()
+
+    if historic is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Historic not found'
+        )
+
+    rows = delete_historic(db_session, user.id, historic.id)
+    db_session.commit()
+    user_data_changed(user.id)
+
+    return ORJSONResponse(
+        content={"message": "Histórico removido com sucesso!", "rows_deleted": rows},
+        status_code=status.HTTP_200_OK
+    )
+
+
 @planilha_router.put('/update')
 def update_vendas(
     data_request: UpdateVendaRequest,
@@ -323,10 +403,18 @@ def update_vendas(
 
     user = get_current_user(token=token, db=db_session)
     
+    # FOR UPDATE: uma edição concorrente da mesma venda espera esta terminar,
+    # senão as duas tirariam do rollup os mesmos valores antigos
     planilha = db_session.query(PlanilhaModel).filter(
         PlanilhaModel.id == data_request.id,
         PlanilhaModel.user_id == user.id
-    ).first()
+    ).with_for_update().first()
+
+    if planilha is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sale not found")
+
+    # Retira a venda do rollup antes da alteração e recoloca com os novos valores
+    apply_rollup_delta(db_session, user.id, PlanilhaModel.id == planilha.id, sign=-1)
 
     for field, value in data_request.dict(exclude_unset=True).items():
         if field == "taxa":
@@ -334,17 +422,102 @@ def update_vendas(
         else:
             setattr(planilha, field, value)
 
+    db_session.flush()
+    apply_rollup_delta(db_session, user.id, PlanilhaModel.id == planilha.id)
     db_session.commit()
+    user_data_changed(user.id)
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={"message": "Dados atualizados com sucesso!"},
         status_code=status.HTTP_200_OK
     )
 
 
+@planilha_router.put('/update/batch')
+def update_vendas_batch(
+    data_request: UpdateVendasBatchRequest,
+    token: str = Depends(oauth_scheme),
+    db_session: Session = Depends(get_db_session)
+):
+
+    user = get_current_user(token=token, db=db_session)
+
+    assignment = data_request.set.dict(exclude_none=True) if data_request.set is not None else {}
+
+    if data_request.items and (data_request.where is not None or assignment):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Send either items or where/set'
+        )
+
+    if data_request.items:
+        if len(data_request.items) > UPDATE_BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'Too many items (max {UPDATE_BATCH_MAX_ITEMS})'
+            )
+        condition, stmt = items_update(user.id, data_request.items)
+    elif data_request.where is not None and data_request.where.dict(exclude_defaults=True) and assignment:
+        # Exige algum critério no filtro: "where" vazio alteraria todas as vendas
+        condition, stmt = matching_update(user.id, data_request.where, assignment)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Nothing to update'
+        )
+
+    # Um UPDATE para todas as vendas e um único commit
+    ids = apply_update(db_session, user.id, condition, stmt)
+    db_session.commit()
+    user_data_changed(user.id)
+
+    updated = set(ids)
+    return ORJSONResponse(
+        content={
+            "message": "Dados atualizados com sucesso!",
+            "rows_updated": len(ids),
+            "not_found": [item.id for item in data_request.items if item.id not in updated]
+        },
+        status_code=status.HTTP_200_OK
+    )
+
+
+@internal_router.get('/cache')
+def get_cache_stats():
+    return ORJSONResponse(
+        content=response_cache.stats(),
+        status_code=status.HTTP_200_OK
+    )
+
+
+@internal_router.get('/pool')
+def get_pool_stats():
+    return ORJSONResponse(
+        content={name: stats.snapshot() for name, stats in pool_stats.items()},
+        status_code=status.HTTP_200_OK
+    )
 
-    
 
+@internal_router.get('/replicas')
+def get_replica_stats():
+    return ORJSONResponse(
+        content=replica_router.snapshot(),
+        status_code=status.HTTP_200_OK
+    )
 
-    
-        
\ No newline at end of file
+
+@internal_router.get('/admission')
+def get_admission_stats():
+    return ORJSONResponse(
+        content={name: limiter.snapshot() for name, limiter in admission_limiters.items()},
+        status_code=status.HTTP_200_OK
+    )
+
+
+@internal_router.get('/metrics')
+def get_metrics():
+    return Response(
+        content=request_metrics.render(),
+        status_code=status.HTTP_200_OK,
+        media_type=PROMETHEUS_CONTENT_TYPE
+    )
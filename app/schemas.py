@@ -1,4 +1,5 @@
 import re
+from typing import List, Optional
 from pydantic import BaseModel, validator
 
 
@@ -46,4 +47,25 @@ class UpdateVendaRequest(BaseModel):
     valor_liquido: float
     taxa: float
     forma_pagamento: str
-    categoria_produto: str
\ No newline at end of file
+    categoria_produto: str
+
+
+class VendaFilter(BaseModel):
+    date_selected: List[str] = []
+    id_historico: Optional[int] = None
+    nome_produto: Optional[str] = None
+    categoria_produto: Optional[str] = None
+    forma_pagamento: Optional[str] = None
+
+
+class VendaAssignment(BaseModel):
+    nome_produto: Optional[str] = None
+    categoria_produto: Optional[str] = None
+    forma_pagamento: Optional[str] = None
+
+
+class UpdateVendasBatchRequest(BaseModel):
+    # Ou a lista de vendas completas, ou o filtro (where) com os campos a alterar (set)
+    items: List[UpdateVendaRequest] = []
+    where: Optional[VendaFilter] = None
+    set: Optional[VendaAssignment] = None
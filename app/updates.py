@@ -0,0 +1,109 @@
+"""
+Alteração de várias vendas numa única instrução UPDATE, sempre limitada
+às vendas do usuário:
+
+- por lista: UPDATE ... FROM (VALUES ...) com os novos valores de cada id;
+- por filtro: UPDATE ... SET campo = valor WHERE <filtro>.
+
+O rollup do dashboard recebe o delta das vendas alteradas (sai com os
+valores antigos, volta com os novos) na mesma transação.
+
+Remover um upload inteiro (delete_historic) também é uma operação de
+conjunto: um DELETE na partição do usuário e as linhas do upload no rollup.
+"""
+from sqlalchemy import Date, Float, Integer, String, and_, cast, column, delete, select, update, values
+from app.filters import planilha_filters
+from database.models import HistoricDashboard, PlanilhaModel, UploadJob
+from database.rollup import apply_rollup_delta, remove_rollup_historic
+
+
+# Campos de texto que o filtro compara e que a alteração por filtro pode mudar
+MATCH_FIELDS = ('nome_produto', 'categoria_produto', 'forma_pagamento')
+
+ITEM_COLUMNS = (
+    ('id', Integer),
+    ('nome_produto', String),
+    ('data_venda', String),
+    ('data_pagamento', String),
+    ('valor_bruto', Float),
+    ('valor_liquido', Float),
+    ('taxa', Float),
+    ('forma_pagamento', String),
+    ('categoria_produto', String),
+)
+
+
+def items_update(user_id: int, items: list):
+    novos = values(*(column(name, type_) for name, type_ in ITEM_COLUMNS), name='novos').data(
+        [tuple(getattr(item, name) for name, _ in ITEM_COLUMNS) for item in items]
+    )
+    assignments = {name: novos.c[name] for name, _ in ITEM_COLUMNS if name != 'id'}
+    # As datas chegam como texto e são convertidas pelo banco, como no PUT /planilha/update
+    assignments.update({name: cast(novos.c[name], Date) for name in ('data_venda', 'data_pagamento')})
+
+    condition = and_(PlanilhaModel.user_id == user_id, PlanilhaModel.id.in_([item.id for item in items]))
+    stmt = update(PlanilhaModel).where(PlanilhaModel.id == novos.c.id, condition).values(assignments)
+    return condition, stmt
+
+
+def matching_update(user_id: int, where, assignment: dict):
+    filters = planilha_filters(user_id, where.date_selected, where.id_historico)
+    filters += [getattr(PlanilhaModel, field) == getattr(where, field)
+                for field in MATCH_FIELDS if getattr(where, field) is not None]
+
+    condition = and_(*filters)
+    return condition, update(PlanilhaModel).where(condition).values(assignment)
+
+
+def apply_update(db_session, user_id: int, condition, stmt) -> list:
+    """
+    Executa o UPDATE mantendo o rollup em dia e devolve os ids alterados.
+    O commit fica a cargo de quem chama.
+
+    As vendas são travadas (FOR UPDATE, em ordem de id) antes do delta de
+    saída; daí em diante tudo usa os ids travados, para o rollup não contar
+    duas vezes uma venda alterada ou incluída por outra transação no meio.
+    """
+    ids = db_session.execute(
+        select(PlanilhaModel.id).where(condition).order_by(PlanilhaModel.id).with_for_update()
+    ).scalars().all()
+    if not ids:
+        return []
+
+    locked = and_(PlanilhaModel.user_id == user_id, PlanilhaModel.id.in_(ids))
+    apply_rollup_delta(db_session, user_id, locked, sign=-1)
+    ids = db_session.execute(
+        stmt.where(PlanilhaModel.id.in_(ids)).returning(PlanilhaModel.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    apply_rollup_delta(db_session, user_id, locked)
+    return ids
+
+
+def delete_historic(db_session, user_id: int, historic_dashboard_id: int) -> int:
+    """
+    Apaga o histórico e as vendas dele; devolve quantas vendas foram
+    apagadas. O commit fica a cargo de quem chama.
+
+    As vendas são apagadas antes do rollup: o DELETE trava as linhas, então
+    uma edição concorrente termina antes (e o DELETE do rollup, com um
+    snapshot novo, enxerga o delta dela) ou espera e não acha mais a venda.
+    """
+    # user_id na condição: o PostgreSQL só varre a partição do usuário
+    rows = db_session.execute(
+        delete(PlanilhaModel)
+        .where(PlanilhaModel.user_id == user_id, PlanilhaModel.historic_dashboard_id == historic_dashboard_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    remove_rollup_historic(db_session, user_id, historic_dashboard_id)
+    db_session.execute(
+        update(UploadJob)
+        .where(UploadJob.user_id == user_id, UploadJob.historic_dashboard_id == historic_dashboard_id)
+        .values(historic_dashboard_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db_session.execute(
+        delete(HistoricDashboard)
+        .where(HistoricDashboard.user_id == user_id, HistoricDashboard.id == historic_dashboard_id)
+        .execution_options(synchronize_session=False)
+    )
+    return rows
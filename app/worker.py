@@ -0,0 +1,333 @@
+"""
+Workers da fila de uploads (`upload_jobs`).
+
+Cada processo busca o próximo job pendente com SELECT ... FOR UPDATE SKIP
+LOCKED, de modo que vários workers (e várias máquinas) dividem a fila sem
+pegar o mesmo job. Jobs `running` sem heartbeat há mais de
+UPLOAD_JOB_TIMEOUT segundos (worker que morreu) voltam a ser elegíveis.
+
+Nos uploads em lote, cada arquivo (ou aba de XLSX) é lido em paralelo num
+pool de UPLOAD_PARSE_WORKERS processos e vira um histórico próprio; todos
+são gravados na mesma transação.
+
+Um arquivo que o usuário já enviou (mesmo sha256) não é lido de novo, e
+vendas que ele já tem (mesmo fingerprint) não são gravadas de novo: ambos
+entram em `rows_skipped`.
+
+Uso:
+    python -m app.worker            # UPLOAD_WORKERS processos
+"""
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+from os import getenv
+from sqlalchemy import and_, func, or_, select, update
+from app.ingestion import (
+    content_hash,
+    find_uploaded,
+    ingest_rows,
+    iter_upload_rows,
+    parse_upload,
+    upload_sheets
+)
+from database.connection import Session
+from database.models import HistoricDashboard, PlanilhaModel, UploadJob
+from database.notifications import notify_user_data_changed
+from database.rollup import apply_rollup_delta
+
+
+UPLOAD_WORKERS = int(getenv('UPLOAD_WORKERS', 2))
+UPLOAD_POLL_INTERVAL = float(getenv('UPLOAD_POLL_INTERVAL', 1))
+UPLOAD_JOB_TIMEOUT = int(getenv('UPLOAD_JOB_TIMEOUT', 300))
+UPLOAD_JOB_MAX_ATTEMPTS = int(getenv('UPLOAD_JOB_MAX_ATTEMPTS', 3))
+# 0 lê os arquivos do lote no próprio worker, um depois do outro
+UPLOAD_PARSE_WORKERS = int(getenv('UPLOAD_PARSE_WORKERS', os.cpu_count() or 1))
+# Heartbeat enquanto as partes do lote estão sendo lidas
+UPLOAD_HEARTBEAT_INTERVAL = float(getenv('UPLOAD_HEARTBEAT_INTERVAL', 30))
+
+logger = logging.getLogger(__name__)
+
+
+def claim_job():
+    with Session() as session:
+        job = session.execute(
+            select(UploadJob)
+            .where(
+                or_(
+                    UploadJob.status == 'pending',
+                    and_(
+                        UploadJob.status == 'running',
+                        UploadJob.heartbeat_at < func.now() - timedelta(seconds=UPLOAD_JOB_TIMEOUT)
+                    )
+                )
+            )
+            .order_by(UploadJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar_one_or_none()
+
+        if job is None:
+            return None
+
+        if job.attempts >= UPLOAD_JOB_MAX_ATTEMPTS:
+            job.status = 'failed'
+            job.errors = job.errors or 'Número máximo de tentativas atingido'
+            job.finished_at = func.now()
+            session.commit()
+            return None
+
+        job.status = 'running'
+        job.attempts += 1
+        job.started_at = func.now()
+        job.heartbeat_at = func.now()
+        session.commit()
+        return job.id
+
+
+def report_progress(job_id: int, rows_parsed: int, rows_inserted: int):
+    # Sessão própria: o progresso fica visível antes do commit da ingestão
+    with Session() as session:
+        session.execute(
+            update(UploadJob)
+            .where(UploadJob.id == job_id)
+            .values(rows_parsed=rows_parsed, rows_inserted=rows_inserted, heartbeat_at=func.now())
+        )
+        session.commit()
+
+
+_parse_pool = None
+
+
+def parse_pool() -> ProcessPoolExecutor:
+    # Criado na primeira vez que um lote é processado e reaproveitado depois
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=UPLOAD_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _parse_pool
+
+
+def duplicate_part(filename: str, uploaded: tuple) -> dict:
+    historic_id, rows = uploaded
+    return {
+        "filename": filename,
+        "sheet": None,
+        "id_historico": historic_id,
+        "rows": 0,
+        "rows_skipped": rows,
+        "duplicate": True
+    }
+
+
+def finish_part(session, historic: HistoricDashboard, filename: str, sheet_name: str, parsed: int, inserted: int) -> dict:
+    # Sem nenhuma venda nova o histórico não é mantido
+    if inserted == 0:
+        session.delete(historic)
+        session.flush()
+
+    return {
+        "filename": filename,
+        "sheet": sheet_name,
+        "id_historico": historic.id if inserted else None,
+        "rows": inserted,
+        "rows_skipped": parsed - inserted,
+        "duplicate": False
+    }
+
+
+def ingest_single(session, job: UploadJob) -> list:
+    digest = content_hash(job.arquivo)
+    uploaded = find_uploaded(session, job.user_id, digest)
+    if uploaded is not None:
+        return [duplicate_part(job.filename, uploaded)]
+
+    historic = HistoricDashboard(
+        user_id=job.user_id,
+        data_upload_planilha=job.data_upload_planilha,
+        content_hash=digest
+    )
+    session.add(historic)
+    session.flush()
+
+    rows = iter_upload_rows(io.BytesIO(job.arquivo))
+    parsed, inserted = ingest_rows(
+        session,
+        rows,
+        job.user_id,
+        historic.id,
+        on_progress=lambda parsed, inserted: report_progress(job.id, parsed, inserted)
+    )
+
+    return [finish_part(session, historic, job.filename, None, parsed, inserted)]
+
+
+def ingest_batch(session, job: UploadJob) -> list:
+    """
+    Grava cada arquivo/aba do lote como um histórico. O commit fica a cargo
+    de quem chama.
+
+    Com o pool de parsing, no máximo UPLOAD_PARSE_WORKERS partes são lidas
+    ao mesmo tempo e cada uma é inserida (em blocos) assim que a leitura
+    termina, então a memória depende do tamanho das partes em andamento, não
+    do lote. Sem o pool, cada parte vai do arquivo ao banco em blocos, como
+    em ingest_single. Os históricos são criados antes, na ordem do envio.
+    """
+    parts = []
+    tasks = []
+    digests = set()
+    for file in job.files:
+        digest = content_hash(file.arquivo)
+        uploaded = find_uploaded(session, job.user_id, digest)
+        if uploaded is not None:
+            parts.append(duplicate_part(file.filename, uploaded))
+        elif digest in digests:
+            # O mesmo arquivo duas vezes no lote: as vendas já entram pelo primeiro
+            parts.append(duplicate_part(file.filename, (None, 0)))
+        else:
+            digests.add(digest)
+            tasks.extend(
+                (file.filename, sheet_name, file.arquivo, digest)
+                for sheet_name in upload_sheets(file.arquivo)
+            )
+
+    historics = [
+        HistoricDashboard(user_id=job.user_id, data_upload_planilha=job.data_upload_planilha, content_hash=digest)
+        for _, _, _, digest in tasks
+    ]
+    session.add_all(historics)
+    session.flush()
+
+    task_parts = [None] * len(tasks)
+    totals = {"parsed": 0, "inserted": 0}
+
+    def part_error(index: int, error: Exception) -> ValueError:
+        # Diz qual arquivo/aba do lote falhou
+        filename, sheet_name, _, _ = tasks[index]
+        label = f'{filename} [{sheet_name}]' if sheet_name else filename
+        return ValueError(f'{label}: {error}')
+
+    def ingest_part(index: int, rows, normalized: bool):
+        filename, sheet_name, _, _ = tasks[index]
+        before = dict(totals)
+        try:
+            parsed, inserted = ingest_rows(
+                session,
+                rows,
+                job.user_id,
+                historics[index].id,
+                on_progress=lambda parsed, inserted: report_progress(
+                    job.id, before["parsed"] + parsed, before["inserted"] + inserted
+                ),
+                normalized=normalized
+            )
+        except Exception as e:
+            raise part_error(index, e) from e
+        totals["parsed"] += parsed
+        totals["inserted"] += inserted
+
+        if parsed:
+            task_parts[index] = finish_part(session, historics[index], filename, sheet_name, parsed, inserted)
+        else:
+            # Abas vazias (sem cabeçalho ou sem vendas) não viram histórico
+            session.delete(historics[index])
+            session.flush()
+
+    if UPLOAD_PARSE_WORKERS > 0 and len(tasks) > 1:
+        pool = parse_pool()
+        waiting = list(enumerate(tasks))
+        running = {}
+        try:
+            while waiting or running:
+                while waiting and len(running) < UPLOAD_PARSE_WORKERS:
+                    index, (_, sheet_name, data, _) = waiting.pop(0)
+                    running[pool.submit(parse_upload, data, job.user_id, sheet_name)] = index
+
+                done, _ = wait(running, timeout=UPLOAD_HEARTBEAT_INTERVAL, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Leitura longa: mantém o heartbeat para o job não ser dado como perdido
+                    report_progress(job.id, totals["parsed"], totals["inserted"])
+                for future in done:
+                    index = running.pop(future)
+                    try:
+                        rows = future.result()
+                    except Exception as e:
+                        raise part_error(index, e) from e
+                    ingest_part(index, rows, normalized=True)
+        finally:
+            for future in running:
+                future.cancel()
+    else:
+        for index, (_, sheet_name, data, _) in enumerate(tasks):
+            ingest_part(index, iter_upload_rows(io.BytesIO(data), sheet_name=sheet_name), normalized=False)
+
+    return parts + [part for part in task_parts if part is not None]
+
+
+def process_job(job_id: int):
+    with Session() as session:
+        job = session.get(UploadJob, job_id)
+
+        try:
+            parts = ingest_batch(session, job) if job.files else ingest_single(session, job)
+            # Só os históricos criados agora entram no rollup (não os de arquivos repetidos)
+            historic_ids = [part["id_historico"] for part in parts if part["rows"]]
+
+            if historic_ids:
+                apply_rollup_delta(session, job.user_id, PlanilhaModel.historic_dashboard_id.in_(historic_ids))
+
+            # Históricos, vendas, rollup e status do job ficam visíveis no mesmo commit
+            inserted = sum(part["rows"] for part in parts)
+            skipped = sum(part["rows_skipped"] for part in parts)
+            job.status = 'done'
+            job.historic_dashboard_id = next(
+                (part["id_historico"] for part in parts if part["id_historico"] is not None), None
+            )
+            job.parts = parts
+            job.rows_parsed = inserted + skipped
+            job.rows_inserted = inserted
+            job.rows_skipped = skipped
+            job.arquivo = None
+            job.files.clear()
+            job.finished_at = func.now()
+            # A API invalida o cache do usuário quando este commit acontece
+            notify_user_data_changed(session, job.user_id)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.exception('Falha ao processar o upload %s', job_id)
+            session.execute(
+                update(UploadJob)
+                .where(UploadJob.id == job_id)
+                .values(status='failed', errors=str(e), rows_inserted=0, rows_skipped=0, finished_at=func.now())
+            )
+            session.commit()
+
+
+def run_worker():
+    while True:
+        job_id = claim_job()
+        if job_id is None:
+            time.sleep(UPLOAD_POLL_INTERVAL)
+            continue
+        process_job(job_id)
+
+
+def main(workers: int = UPLOAD_WORKERS):
+    context = multiprocessing.get_context('spawn')
+    # Não daemon: os workers criam os processos de parsing dos lotes
+    processes = [context.Process(target=run_worker) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
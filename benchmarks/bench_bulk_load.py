@@ -0,0 +1,76 @@
+"""
+Compara linhas por segundo na carga de planilhas:
+
+- orm: um PlanilhaModel por linha + bulk_save_objects (caminho antigo do upload)
+- executemany: INSERT executemany do SQLAlchemy
+- copy: COPY FROM STDIN (database.bulk.copy_planilhas)
+
+Cada carga roda em uma transação desfeita no final, então o banco não muda.
+
+Uso:
+    DATABASE_URL=... python -m benchmarks.bench_bulk_load [--sizes 10000 100000 1000000]
+"""
+import argparse
+import json
+import time
+from sqlalchemy import insert
+from benchmarks.synthetic import generate_rows
+from database.bulk import copy_planilhas
+from database.connection import Session
+from database.models import PlanilhaModel, UserModel
+
+
+def load_orm(session, rows):
+    session.bulk_save_objects([PlanilhaModel(**row) for row in rows])
+    session.flush()
+
+
+def load_executemany(session, rows):
+    session.execute(insert(PlanilhaModel), rows)
+
+
+def load_copy(session, rows):
+    copy_planilhas(session, rows)
+
+
+LOADERS = {
+    'orm': load_orm,
+    'executemany': load_executemany,
+    'copy': load_copy
+}
+
+
+def run(sizes: list, loaders: list) -> list:
+    results = []
+    with Session() as session:
+        user = UserModel(username=f'benchbulk{int(time.time())}', password='-')
+        session.add(user)
+        session.flush()
+
+        for size in sizes:
+            rows = generate_rows(size, user.id)
+            for name in loaders:
+                nested = session.begin_nested()
+                start = time.perf_counter()
+                LOADERS[name](session, rows)
+                elapsed = time.perf_counter() - start
+                nested.rollback()
+
+                results.append({
+                    'loader': name,
+                    'rows': size,
+                    'seconds': round(elapsed, 3),
+                    'rows_per_second': round(size / elapsed)
+                })
+
+        session.rollback()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--loaders', nargs='+', choices=list(LOADERS), default=list(LOADERS))
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.sizes, args.loaders), indent=2))
@@ -0,0 +1,131 @@
+"""
+Mede o DELETE /historico/{id} (um upload inteiro e as vendas dele) numa base
+grande, criada com benchmarks.synthetic: por padrão 20 usuários x 5 uploads
+x 20000 vendas = 2 milhões de vendas em `planilhas`.
+
+Para cada upload removido reporta o tempo da requisição, as vendas apagadas
+e quantas partições de `planilhas` o plano do DELETE visita (deve ser uma:
+a do usuário).
+
+Uso:
+    DATABASE_URL=... python -m benchmarks.bench_delete_upload [--users 20 --uploads 5 --sales 20000] [--deletes 10] [--skip-populate]
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import httpx
+from sqlalchemy import func, select, text
+from app.main import app
+from benchmarks.synthetic import SYNTHETIC_PASSWORD, populate, username
+from database.connection import Session
+from database.models import HistoricDashboard, PlanilhaModel, UserModel
+
+
+def partitions_scanned(session, user_id: int, historic_id: int) -> int:
+    plan = session.execute(
+        text(
+            'EXPLAIN (FORMAT JSON) DELETE FROM planilhas '
+            'WHERE user_id = :user_id AND historic_dashboard_id = :historic_id'
+        ),
+        {'user_id': user_id, 'historic_id': historic_id}
+    ).scalar()
+
+    relations = set()
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if 'Relation Name' in node and node['Relation Name'] != 'planilhas':
+            relations.add(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return len(relations)
+
+
+def pick_uploads(users: int, deletes: int, seed: int) -> list:
+    # (usuário, id do histórico, vendas, partições visitadas) de uploads sorteados
+    with Session() as session:
+        historics = session.execute(
+            select(UserModel.username, HistoricDashboard.user_id, HistoricDashboard.id)
+            .join(UserModel, UserModel.id == HistoricDashboard.user_id)
+            .where(UserModel.username.in_([username(index) for index in range(users)]))
+            .order_by(HistoricDashboard.id)
+        ).all()
+        chosen = random.Random(seed).sample(historics, min(deletes, len(historics)))
+
+        return [
+            {
+                'username': name,
+                'historic_id': historic_id,
+                'rows': session.scalar(
+                    select(func.count()).where(
+                        PlanilhaModel.user_id == user_id,
+                        PlanilhaModel.historic_dashboard_id == historic_id
+                    )
+                ),
+                'partitions_scanned': partitions_scanned(session, user_id, historic_id)
+            }
+            for name, user_id, historic_id in chosen
+        ]
+
+
+async def delete_uploads(uploads: list) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        results = []
+        for upload in uploads:
+            response = await client.post(
+                '/auth/login', json={'username': upload['username'], 'password': SYNTHETIC_PASSWORD}
+            )
+            headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+            start = time.perf_counter()
+            response = await client.delete(f"/historico/{upload['historic_id']}", headers=headers)
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+
+            results.append({
+                **upload,
+                'rows_deleted': response.json()['rows_deleted'],
+                'seconds': round(elapsed, 3),
+                'rows_per_second': round(response.json()['rows_deleted'] / elapsed)
+            })
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--uploads', type=int, default=5)
+    parser.add_argument('--sales', type=int, default=20_000)
+    parser.add_argument('--deletes', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-populate', action='store_true', help='usa os usuários sintéticos já criados')
+    args = parser.parse_args()
+
+    report = {}
+    if not args.skip_populate:
+        start = time.perf_counter()
+        report['populate'] = populate(args.users, args.uploads, args.sales, args.seed)
+        report['populate']['seconds'] = round(time.perf_counter() - start, 1)
+
+    with Session() as session:
+        report['planilhas_rows'] = session.scalar(select(func.count()).select_from(PlanilhaModel))
+
+    deletes = asyncio.run(delete_uploads(pick_uploads(args.users, args.deletes, args.seed)))
+    report['deletes'] = deletes
+    if deletes:
+        report['summary'] = {
+            'median_seconds': round(statistics.median(item['seconds'] for item in deletes), 3),
+            'max_seconds': max(item['seconds'] for item in deletes),
+            'rows_per_second': round(
+                sum(item['rows_deleted'] for item in deletes) / sum(item['seconds'] for item in deletes)
+            )
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
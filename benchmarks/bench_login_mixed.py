@@ -0,0 +1,95 @@
+"""
+Latência de /auth/login e /dashboard/detail sob carga mista, com o hash de
+senha na thread da requisição (antes: PASSWORD_HASH_WORKERS=0) e no pool de
+processos (depois). As requisições passam pelo app ASGI, sem rede.
+
+O cache de respostas é desligado para o dashboard sempre ir ao banco.
+
+Uso:
+    DATABASE_URL=... python -m benchmarks.bench_login_mixed [--seconds 20] [--logins 16] [--dashboards 8]
+"""
+import os
+
+os.environ['RESPONSE_CACHE_MAXSIZE'] = '0'
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+import httpx  # noqa: E402
+from app.auth_user import crypt_context, password_hasher  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.harness import summarize  # noqa: E402
+from benchmarks.synthetic import generate_rows  # noqa: E402
+from database.bulk import copy_planilhas  # noqa: E402
+from database.connection import Session  # noqa: E402
+from database.models import UserModel  # noqa: E402
+from database.rollup import backfill_rollup  # noqa: E402
+
+
+PASSWORD = 'benchmark'
+
+
+def create_user(sales: int) -> str:
+    username = f'benchlogin{int(time.time())}'
+    with Session() as session:
+        user = UserModel(username=username, password=crypt_context.hash(PASSWORD))
+        session.add(user)
+        session.flush()
+        copy_planilhas(session, generate_rows(sales, user.id))
+        backfill_rollup(session, user.id)
+        session.commit()
+    return username
+
+
+async def worker(client, method, url, deadline, latencies, **kwargs):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_mode(username: str, seconds: float, logins: int, dashboards: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        login = {'username': username, 'password': PASSWORD}
+        token = (await client.post('/auth/login', json=login)).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        login_latencies, dashboard_latencies = [], []
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(
+            *(worker(client, 'POST', '/auth/login', deadline, login_latencies, json=login) for _ in range(logins)),
+            *(worker(client, 'GET', '/dashboard/detail', deadline, dashboard_latencies, headers=headers)
+              for _ in range(dashboards))
+        )
+
+    return {
+        'auth_login': summarize(login_latencies, seconds),
+        'dashboard_detail': summarize(dashboard_latencies, seconds)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--logins', type=int, default=16)
+    parser.add_argument('--dashboards', type=int, default=8)
+    parser.add_argument('--sales', type=int, default=50_000)
+    parser.add_argument('--hash-workers', type=int, default=max(password_hasher.workers, 1))
+    args = parser.parse_args()
+
+    username = create_user(args.sales)
+    results = {}
+    for mode, workers in (('inline', 0), ('process_pool', args.hash_workers)):
+        password_hasher.shutdown()
+        password_hasher.workers = workers
+        results[mode] = asyncio.run(run_mode(username, args.seconds, args.logins, args.dashboards))
+    password_hasher.shutdown()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark da montagem de uma página de /planilha/detail, sem banco:
+
+- currency: format_currency valor a valor x format_currency_column por coluna
+- page: linhas formatadas + json da stdlib (como era) x linhas formatadas
+  por coluna + orjson x modo raw (números e datas ISO) + orjson
+
+As linhas imitam o resultado de planilha_rows_select (datas já como texto,
+exceto no modo raw) e vêm de benchmarks.synthetic.
+
+Uso:
+    python -m benchmarks.bench_serialization [--rows 1000 50000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+import orjson
+from app.depends import PLANILHA_ROW_FIELDS, format_currency, format_currency_column, format_planilha_rows
+from benchmarks.synthetic import generate_rows
+
+
+Row = namedtuple('Row', PLANILHA_ROW_FIELDS + ('historic_dashboard_id',))
+
+CURRENCY_FIELDS = ('valor_bruto', 'valor_liquido', 'taxa')
+
+
+def make_rows(size: int, raw: bool) -> list:
+    rows = []
+    for id, row in enumerate(generate_rows(size, 1), start=1):
+        values = {**row, 'id': id}
+        if not raw:
+            for field in ('data_venda', 'data_pagamento'):
+                values[field] = row[field].strftime('%d/%m/%Y')
+        rows.append(Row(**{field: values[field] for field in Row._fields}))
+    return rows
+
+
+def legacy_page(rows: list) -> bytes:
+    # Como era: format_currency por valor e JSONResponse da stdlib
+    planilhas = [
+        {
+            **{field: getattr(row, field) for field in PLANILHA_ROW_FIELDS},
+            **{field: format_currency(getattr(row, field)) for field in CURRENCY_FIELDS},
+        }
+        for row in rows
+    ]
+    return json.dumps({"planilhas": planilhas}, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def page(rows: list, raw: bool = False) -> bytes:
+    return orjson.dumps({"planilhas": format_planilha_rows(rows, raw)})
+
+
+def best_of(repeat: int, function, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes: list, repeat: int) -> list:
+    results = []
+    for size in sizes:
+        formatted = make_rows(size, raw=False)
+        raw = make_rows(size, raw=True)
+        values = [row.valor_bruto for row in formatted]
+
+        assert format_currency_column(values) == [format_currency(value) for value in values]
+        assert orjson.loads(page(formatted)) == json.loads(legacy_page(formatted))
+
+        timings = {
+            'currency_per_value': best_of(repeat, lambda: [format_currency(value) for value in values]),
+            'currency_column': best_of(repeat, format_currency_column, values),
+            'page_stdlib_json': best_of(repeat, legacy_page, formatted),
+            'page_orjson': best_of(repeat, page, formatted),
+            'page_raw_orjson': best_of(repeat, page, raw, True),
+        }
+        results.append({
+            'rows': size,
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in timings.items()},
+            'currency_speedup': round(timings['currency_per_value'] / timings['currency_column'], 2),
+            'page_speedup': round(timings['page_stdlib_json'] / timings['page_orjson'], 2),
+            'raw_page_speedup': round(timings['page_stdlib_json'] / timings['page_raw_orjson'], 2),
+            'page_bytes': len(page(formatted)),
+            'raw_page_bytes': len(page(raw, True)),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 50_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
@@ -0,0 +1,68 @@
+"""
+Compara o tempo de leitura de uma planilha de upload em cada formato:
+
+- xlsx: openpyxl em modo read-only (app.ingestion.iter_xlsx_rows)
+- csv: leitor multithread do Arrow (app.ingestion.iter_csv_rows)
+- parquet: pyarrow.parquet em lotes (app.ingestion.iter_parquet_rows)
+
+Os arquivos são gerados com benchmarks.synthetic a partir das mesmas vendas,
+e o benchmark confere que os três formatos produzem as mesmas linhas
+(depois de normalize_row). Não usa o banco.
+
+Uso:
+    python -m benchmarks.bench_upload_formats [--sizes 10000 100000] [--repeat 3]
+"""
+import argparse
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+from app.ingestion import iter_upload_rows, normalize_row
+from benchmarks.synthetic import FILE_WRITERS, generate_rows
+
+
+def parse(data: bytes) -> list:
+    return [normalize_row(row, 1, None) for row in iter_upload_rows(io.BytesIO(data))]
+
+
+def run(sizes: list, repeat: int) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            rows = generate_rows(size, 1)
+            expected = None
+
+            for file_format, write in FILE_WRITERS.items():
+                path = Path(directory) / f'vendas_{size}.{file_format}'
+                write(path, rows)
+                data = path.read_bytes()
+
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    parsed = parse(data)
+                    timings.append(time.perf_counter() - start)
+
+                if expected is None:
+                    expected = parsed
+
+                best = min(timings)
+                results.append({
+                    'format': file_format,
+                    'rows': size,
+                    'file_bytes': len(data),
+                    'seconds': round(best, 3),
+                    'rows_per_second': round(size / best),
+                    'identical_rows': parsed == expected
+                })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.sizes, args.repeat), indent=2))
@@ -0,0 +1,232 @@
+"""
+Benchmark das rotas principais pelo app ASGI (httpx, sem rede), sobre os
+usuários criados por `benchmarks.synthetic`:
+
+- dashboard: GET /dashboard/detail (sem filtro e com meses sorteados)
+- planilha: GET /planilha/detail (primeira página de --planilha-limit linhas)
+- login: POST /auth/login
+- upload: PUT /planilha/upload com os arquivos de --xlsx-dir (no máximo
+  --max-uploads envios); depois do cenário os jobs enfileirados são
+  processados aqui mesmo e o tempo entra no resultado. Como os uploads
+  aumentam a base, este cenário roda por último.
+
+Cada cenário roda --concurrency clientes durante --seconds e reporta
+throughput e p50/p95/p99 em JSON. O cache de respostas fica desligado,
+a não ser com --cache. Com --baseline, inclui a variação em relação a
+um resultado anterior.
+
+Uso:
+    DATABASE_URL=... python -m benchmarks.synthetic --users 10 --xlsx-dir bench-data
+    DATABASE_URL=... python -m benchmarks.harness --users 10 --xlsx-dir bench-data \\
+        [--scenarios dashboard planilha login upload] [--output after.json] [--baseline before.json]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+from app.cache import response_cache
+from app.main import app
+from app.worker import claim_job, process_job
+from benchmarks.synthetic import SYNTHETIC_PASSWORD, username
+
+
+SCENARIOS = ('dashboard', 'planilha', 'login', 'upload')
+
+UPLOAD_EXTENSIONS = ('.xlsx', '.csv', '.parquet')
+
+MESES = [f'{month:02d}/2024' for month in range(1, 13)]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+def summarize(latencies: list, seconds: float, errors: int = 0) -> dict:
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / seconds, 2),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else None
+    }
+
+
+class Scenario:
+    def __init__(self, client: httpx.AsyncClient, tokens: list, args):
+        self.client = client
+        self.tokens = tokens
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.files = sorted(
+            path for path in Path(args.xlsx_dir).iterdir() if path.suffix in UPLOAD_EXTENSIONS
+        ) if args.xlsx_dir else []
+
+    def headers(self) -> dict:
+        return {'Authorization': f'Bearer {self.rnd.choice(self.tokens)}'}
+
+    def dashboard(self):
+        params = {}
+        if self.rnd.random() < 0.5:
+            params['date_selected[]'] = self.rnd.sample(MESES, self.rnd.randint(1, 3))
+        return self.client.get('/dashboard/detail', params=params, headers=self.headers())
+
+    def planilha(self):
+        params = {'limit': self.args.planilha_limit}
+        if self.rnd.random() < 0.5:
+            params['date_selected[]'] = self.rnd.sample(MESES, self.rnd.randint(1, 3))
+        return self.client.get('/planilha/detail', params=params, headers=self.headers())
+
+    def upload(self):
+        path = self.rnd.choice(self.files)
+        files = {'selected_file': (path.name, path.read_bytes(), 'application/octet-stream')}
+        return self.client.put('/planilha/upload', files=files, headers=self.headers())
+
+    def login(self):
+        user = username(self.rnd.randrange(self.args.users))
+        return self.client.post('/auth/login', json={'username': user, 'password': SYNTHETIC_PASSWORD})
+
+
+async def run_scenario(
+    scenario: Scenario,
+    name: str,
+    seconds: float,
+    concurrency: int,
+    max_requests: int = None
+) -> dict:
+    request = getattr(scenario, name)
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def client_loop(deadline: float):
+        nonlocal errors, sent
+        while time.perf_counter() < deadline and (max_requests is None or sent < max_requests):
+            sent += 1
+            start = time.perf_counter()
+            response = await request()
+            if response.is_success:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client_loop(deadline) for _ in range(concurrency)))
+    return summarize(latencies, seconds, errors)
+
+
+def drain_upload_jobs() -> dict:
+    # Processa os uploads enfileirados pelo cenário, como um worker faria
+    jobs = 0
+    start = time.perf_counter()
+    while (job_id := claim_job()) is not None:
+        process_job(job_id)
+        jobs += 1
+    elapsed = time.perf_counter() - start
+    return {
+        'jobs': jobs,
+        'seconds': round(elapsed, 3),
+        'jobs_per_second': round(jobs / elapsed, 2) if jobs else None
+    }
+
+
+async def run(args) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        tokens = []
+        for index in range(args.users):
+            response = await client.post(
+                '/auth/login', json={'username': username(index), 'password': SYNTHETIC_PASSWORD}
+            )
+            response.raise_for_status()
+            tokens.append(response.json()['access_token'])
+
+        scenario = Scenario(client, tokens, args)
+        results = {}
+        for name in sorted(args.scenarios, key=SCENARIOS.index):
+            if name == 'upload' and not scenario.files:
+                raise SystemExit('O cenário upload precisa de --xlsx-dir com arquivos .xlsx, .csv ou .parquet')
+
+            max_requests = args.max_uploads if name == 'upload' else None
+            results[name] = await run_scenario(scenario, name, args.seconds, args.concurrency, max_requests)
+            if name == 'upload':
+                results[name]['processing'] = await asyncio.to_thread(drain_upload_jobs)
+
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    # Variação relativa (em %) de cada métrica em relação ao baseline
+    deltas = {}
+    for name, summary in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        deltas[name] = {
+            metric: round((summary[metric] - before[metric]) / before[metric] * 100, 1)
+            for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+            if summary.get(metric) is not None and before.get(metric)
+        }
+    return deltas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--max-uploads', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--planilha-limit', type=int, default=500)
+    parser.add_argument('--xlsx-dir')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache', action='store_true', help='mantém o cache de respostas ligado')
+    parser.add_argument('--output', help='grava o resultado neste arquivo JSON')
+    parser.add_argument('--baseline', help='resultado JSON anterior para comparação')
+    args = parser.parse_args()
+
+    if not args.cache:
+        response_cache.maxsize = 0
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': {
+            key: value for key, value in vars(args).items() if key not in ('output', 'baseline')
+        },
+        'results': asyncio.run(run(args))
+    }
+
+    if args.baseline:
+        report['change_pct'] = compare(report['results'], json.loads(Path(args.baseline).read_text()))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Gera dados sintéticos parecidos com os relatórios reais de vendas: N usuários,
+M uploads por usuário e K vendas por upload, com formas de pagamento
+realistas (Pix, Crédito, Débito, Boleto) e produtos/categorias de cauda
+longa. Opcionalmente grava um arquivo por upload (XLSX, CSV ou Parquet),
+no layout que o `PUT /planilha/upload` espera.
+
+Os usuários se chamam `synthetic<n>` e têm a senha SYNTHETIC_PASSWORD.
+
+Uso:
+    DATABASE_URL=... python -m benchmarks.synthetic --users 10 --uploads 3 --sales 20000 [--xlsx-dir bench-data] [--file-format csv]
+"""
+import argparse
+import csv
+import json
+import random
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from app.auth_user import crypt_context
+from app.ingestion import COLUMNS, HEADER_ROWS
+from database.bulk import copy_planilhas
+from database.connection import Session
+from database.models import HistoricDashboard, UserModel
+from database.rollup import backfill_rollup
+
+
+SYNTHETIC_PASSWORD = 'synthetic'
+USERNAME_PREFIX = 'synthetic'
+
+# Participação aproximada de cada forma de pagamento e a taxa cobrada
+FORMAS_PAGAMENTO = {
+    'Pix': (0.45, 0.0099),
+    'Crédito': (0.30, 0.0499),
+    'Débito': (0.17, 0.0199),
+    'Boleto': (0.08, 0.0349),
+}
+
+CATEGORIAS = [
+    'Camisetas', 'Calças', 'Vestidos', 'Calçados', 'Acessórios', 'Bolsas',
+    'Moda íntima', 'Infantil', 'Esportes', 'Beleza', 'Perfumaria', 'Casa',
+    'Cama e banho', 'Eletrônicos', 'Informática', 'Celulares', 'Games',
+    'Livros', 'Papelaria', 'Brinquedos', 'Pet', 'Jardinagem', 'Ferramentas',
+    'Automotivo', 'Suplementos', 'Mercearia', 'Bebidas', 'Artesanato',
+    'Instrumentos musicais', 'Viagem',
+]
+
+PRODUTOS_POR_CATEGORIA = 40
+
+# Dias entre a venda e o pagamento, por forma de pagamento
+PRAZOS_PAGAMENTO = {
+    'Pix': (0,),
+    'Débito': (0, 1),
+    'Crédito': (30,),
+    'Boleto': (1, 2, 3),
+}
+
+
+def _long_tail_index(rnd: random.Random, size: int, alpha: float) -> int:
+    # Distribuição de Pareto: poucos itens concentram a maior parte das vendas
+    return min(int(rnd.paretovariate(alpha)) - 1, size - 1)
+
+
+def generate_rows(
+    size: int,
+    user_id: int,
+    seed: int = 42,
+    historic_dashboard_id: int = None,
+    start: date = date(2024, 1, 1),
+    days: int = 365
+) -> list:
+    rnd = random.Random(seed)
+    formas = list(FORMAS_PAGAMENTO)
+    pesos = [peso for peso, _ in FORMAS_PAGAMENTO.values()]
+
+    rows = []
+    for _ in range(size):
+        forma_pagamento = rnd.choices(formas, pesos)[0]
+        categoria = CATEGORIAS[_long_tail_index(rnd, len(CATEGORIAS), 1.3)]
+        produto = _long_tail_index(rnd, PRODUTOS_POR_CATEGORIA, 1.1)
+        data_venda = start + timedelta(days=rnd.randrange(days))
+        valor_bruto = round(min(rnd.lognormvariate(4.2, 0.9), 5000), 2)
+        taxa = round(valor_bruto * FORMAS_PAGAMENTO[forma_pagamento][1], 2)
+
+        rows.append({
+            'user_id': user_id,
+            'historic_dashboard_id': historic_dashboard_id,
+            'data_venda': data_venda,
+            'data_pagamento': data_venda + timedelta(days=rnd.choice(PRAZOS_PAGAMENTO[forma_pagamento])),
+            'valor_bruto': valor_bruto,
+            'valor_liquido': round(valor_bruto - taxa, 2),
+            'taxa': taxa,
+            'forma_pagamento': forma_pagamento,
+            'nome_produto': f'{categoria} - Produto {produto + 1:03d}',
+            'categoria_produto': categoria
+        })
+    return rows
+
+
+def write_xlsx(path, rows: list):
+    """
+    Grava as vendas no layout do relatório exportado: HEADER_ROWS linhas de
+    cabeçalho, a linha com os nomes das colunas e as datas como DD-MM-YYYY.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Vendas')
+
+    sheet.append(['Relatório de vendas'])
+    for _ in range(HEADER_ROWS - 1):
+        sheet.append([])
+
+    sheet.append(list(COLUMNS))
+    for row in rows:
+        sheet.append([
+            row[field].strftime('%d-%m-%Y') if isinstance(row[field], date) else row[field]
+            for field in COLUMNS.values()
+        ])
+
+    workbook.save(path)
+
+
+def write_csv(path, rows: list):
+    # Como os PDVs exportam: separador ";", vírgula decimal e datas DD-MM-YYYY
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(list(COLUMNS))
+        for row in rows:
+            writer.writerow([
+                row[field].strftime('%d-%m-%Y') if isinstance(row[field], date)
+                else str(row[field]).replace('.', ',') if isinstance(row[field], float)
+                else row[field]
+                for field in COLUMNS.values()
+            ])
+
+
+def write_parquet(path, rows: list):
+    # Tipos nativos (date32, float64) e os nomes de coluna do relatório
+    table = pa.table({column: [row[field] for row in rows] for column, field in COLUMNS.items()})
+    pq.write_table(table, path)
+
+
+FILE_WRITERS = {
+    'xlsx': write_xlsx,
+    'csv': write_csv,
+    'parquet': write_parquet,
+}
+
+
+def username(index: int) -> str:
+    return f'{USERNAME_PREFIX}{index}'
+
+
+def populate(
+    users: int,
+    uploads: int,
+    sales: int,
+    seed: int = 42,
+    xlsx_dir: str = None,
+    file_format: str = 'xlsx'
+) -> dict:
+    """
+    Cria (ou completa) os usuários sintéticos com `uploads` históricos de
+    `sales` vendas cada e recalcula o rollup do dashboard deles.
+    """
+    if xlsx_dir is not None:
+        Path(xlsx_dir).mkdir(parents=True, exist_ok=True)
+
+    password = crypt_context.hash(SYNTHETIC_PASSWORD)
+    files = []
+    total = 0
+
+    with Session() as session:
+        for index in range(users):
+            user = session.query(UserModel).filter_by(username=username(index)).first()
+            if user is None:
+                user = UserModel(username=username(index), password=password)
+                session.add(user)
+                session.flush()
+
+            for upload in range(uploads):
+                historic = HistoricDashboard(
+                    user_id=user.id,
+                    data_upload_planilha=datetime(2025, 1, 1) + timedelta(days=upload)
+                )
+                session.add(historic)
+                session.flush()
+
+                rows = generate_rows(sales, user.id, seed=seed + index * uploads + upload,
+                                     historic_dashboard_id=historic.id)
+                total += copy_planilhas(session, rows)
+
+                if xlsx_dir is not None:
+                    path = Path(xlsx_dir) / f'{username(index)}_{upload}.{file_format}'
+                    FILE_WRITERS[file_format](path, rows)
+                    files.append(str(path))
+
+            backfill_rollup(session, user.id)
+            session.commit()
+
+    return {
+        'users': [username(index) for index in range(users)],
+        'uploads_per_user': uploads,
+        'sales_per_upload': sales,
+        'rows_inserted': total,
+        'xlsx_files': files
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--uploads', type=int, default=3)
+    parser.add_argument('--sales', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--xlsx-dir')
+    parser.add_argument('--file-format', choices=list(FILE_WRITERS), default='xlsx')
+    args = parser.parse_args()
+
+    summary = populate(args.users, args.uploads, args.sales, args.seed, args.xlsx_dir, args.file_format)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,104 @@
+import csv
+import io
+from sqlalchemy import insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database.models import PlanilhaModel
+
+
+PLANILHA_COLUMNS = (
+    'user_id',
+    'historic_dashboard_id',
+    'data_venda',
+    'data_pagamento',
+    'valor_bruto',
+    'valor_liquido',
+    'taxa',
+    'forma_pagamento',
+    'nome_produto',
+    'categoria_produto',
+    'fingerprint'
+)
+
+# Colunas em que "" é lido como NULL pelo COPY (FORCE_NULL)
+NULLABLE_COLUMNS = ('user_id', 'historic_dashboard_id', 'fingerprint')
+
+# Tabela temporária (uma por transação) que recebe o COPY antes do INSERT ... ON CONFLICT
+STAGING_TABLE = 'planilhas_staging'
+
+
+def supports_copy(connection) -> bool:
+    return connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+
+
+def _rows_to_csv(rows: list) -> io.StringIO:
+    # Texto entre aspas e números sem aspas; None vira "" (ver NULLABLE_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+    for row in rows:
+        writer.writerow([row.get(column) for column in PLANILHA_COLUMNS])
+    buffer.seek(0)
+    return buffer
+
+
+def copy_planilhas(db_session, rows: list, table: str = PlanilhaModel.__tablename__) -> int:
+    """
+    Insere as linhas normalizadas em `planilhas` com COPY FROM STDIN pela
+    conexão psycopg2 da sessão (mesma transação). Em outros dialetos usa
+    um INSERT executemany.
+    """
+    if not rows:
+        return 0
+
+    connection = db_session.connection()
+
+    if not supports_copy(connection):
+        db_session.execute(insert(PlanilhaModel), rows)
+        return len(rows)
+
+    columns = ', '.join(PLANILHA_COLUMNS)
+    nullable = ', '.join(NULLABLE_COLUMNS)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, FORCE_NULL ({nullable}))",
+            _rows_to_csv(rows)
+        )
+    finally:
+        cursor.close()
+
+    return len(rows)
+
+
+def insert_planilhas(db_session, rows: list) -> int:
+    """
+    Insere as linhas ignorando as que o usuário já tem (mesmo `fingerprint`,
+    pelo índice único em (user_id, fingerprint)). As linhas vão por COPY
+    para uma tabela temporária e de lá para `planilhas` com
+    INSERT ... ON CONFLICT DO NOTHING. Devolve quantas foram inseridas.
+    """
+    if not rows:
+        return 0
+
+    connection = db_session.connection()
+
+    if not supports_copy(connection):
+        stmt = (
+            pg_insert(PlanilhaModel)
+            .on_conflict_do_nothing(index_elements=['user_id', 'fingerprint'])
+            .returning(PlanilhaModel.id)
+        )
+        return len(db_session.execute(stmt, rows).all())
+
+    columns = ', '.join(PLANILHA_COLUMNS)
+    db_session.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ON COMMIT DROP AS "
+        f"SELECT {columns} FROM {PlanilhaModel.__tablename__} WITH NO DATA"
+    ))
+    copy_planilhas(db_session, rows, table=STAGING_TABLE)
+    result = db_session.execute(text(
+        f"INSERT INTO {PlanilhaModel.__tablename__} ({columns}) "
+        f"SELECT {columns} FROM {STAGING_TABLE} "
+        f"ON CONFLICT (user_id, fingerprint) DO NOTHING"
+    ))
+    db_session.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+    return result.rowcount
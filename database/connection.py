@@ -1,9 +1,36 @@
 from os import getenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+import database.instrumentation  # noqa: F401 (registra os eventos de contagem de queries)
+from database.pool import (
+    InstrumentedAsyncAdaptedQueuePool,
+    InstrumentedQueuePool,
+    instrument_engine,
+    pool_options
+)
 
 
 DATABASE_URL = getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-Session = sessionmaker(bind=engine)
\ No newline at end of file
+
+def async_database_url(url: str):
+    # Mesmo banco do DATABASE_URL, pelo driver asyncpg
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    sslmode = async_url.query.get("sslmode")
+    if sslmode is not None:
+        # asyncpg não conhece sslmode; o equivalente é o parâmetro ssl
+        async_url = async_url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return async_url
+
+
+ASYNC_DATABASE_URL = getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options())
+instrument_engine("sync", engine)
+Session = sessionmaker(bind=engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncAdaptedQueuePool, **pool_options())
+instrument_engine("async", async_engine.sync_engine)
+AsyncSession = async_sessionmaker(bind=async_engine, expire_on_commit=False)
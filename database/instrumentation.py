@@ -0,0 +1,62 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Contadores ativos no contexto atual (blocos count_queries() aninhados)
+_active_counters: ContextVar = ContextVar('query_counters', default=())
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.rows = 0
+
+
+def _rows_returned(cursor) -> int:
+    if cursor.description is None:
+        return 0
+    if cursor.rowcount >= 0:
+        return cursor.rowcount
+    # O adaptador asyncpg do SQLAlchemy já buscou as linhas, mas deixa rowcount = -1.
+    # Cursores no servidor (streaming) ainda não buscaram nada e contam 0.
+    return len(getattr(cursor, '_rows', ()))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counters = _active_counters.get()
+    if not counters:
+        return
+    for counter in counters:
+        counter.count += 1
+    if context is not None:
+        context._query_started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    counters = _active_counters.get()
+    started_at = getattr(context, '_query_started_at', None)
+    if not counters or started_at is None:
+        return
+    duration = time.perf_counter() - started_at
+    rows = _rows_returned(cursor)
+    for counter in counters:
+        counter.duration += duration
+        counter.rows += rows
+
+
+@contextmanager
+def count_queries():
+    # Conta as queries executadas dentro do bloco (mesmo contexto/thread),
+    # com o tempo gasto no banco e as linhas devolvidas
+    counter = QueryCounter()
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
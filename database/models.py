@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Date, DateTime, Float, Integer, String, ForeignKey
+from sqlalchemy import DDL, Column, Date, DateTime, Float, Index, Integer, JSON, LargeBinary, String, Text, ForeignKey, UniqueConstraint, event, func
 from sqlalchemy.orm import relationship, declarative_base
 
 
 Base = declarative_base()
 
+# Partições HASH (user_id) de `planilhas`; mudar o número exige uma migração que recrie a tabela
+PLANILHAS_PARTITIONS = 16
+
 
 class UserModel(Base):
     __tablename__ = "users"
@@ -16,7 +19,8 @@ class UserModel(Base):
 class PlanilhaModel(Base):
     __tablename__ = "planilhas"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    # Na chave primária porque a tabela é particionada por hash de user_id
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     user = relationship("UserModel", back_populates="planilhas")
     data_venda = Column(Date, nullable=False)
     data_pagamento = Column(Date, nullable=False)
@@ -27,10 +31,98 @@ class PlanilhaModel(Base):
     nome_produto = Column(String, nullable=False)
     categoria_produto = Column(String, nullable=False)
     historic_dashboard_id = Column(Integer, ForeignKey("historic_dashboard.id"))
+    # md5 das colunas de negócio da linha no arquivo enviado (ver app.ingestion.row_fingerprint);
+    # vazio nas vendas cadastradas manualmente
+    fingerprint = Column(String(32))
+
+    __table_args__ = (
+        Index("ix_planilhas_user_id_data_venda", "user_id", "data_venda"),
+        Index("ix_planilhas_user_id_historic_dashboard_id", "user_id", "historic_dashboard_id"),
+        Index("uq_planilhas_user_id_fingerprint", "user_id", "fingerprint", unique=True),
+        {"postgresql_partition_by": "HASH (user_id)"},
+    )
+    # Na sessão as vendas continuam identificadas só pelo id
+    __mapper_args__ = {"primary_key": [id]}
+
+
+for _remainder in range(PLANILHAS_PARTITIONS):
+    event.listen(
+        PlanilhaModel.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE planilhas_p{_remainder} PARTITION OF planilhas "
+            f"FOR VALUES WITH (MODULUS {PLANILHAS_PARTITIONS}, REMAINDER {_remainder})"
+        ).execute_if(dialect="postgresql")
+    )
 
 
 class HistoricDashboard(Base):
     __tablename__ = "historic_dashboard"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    data_upload_planilha = Column(DateTime, nullable=False)
\ No newline at end of file
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    data_upload_planilha = Column(DateTime, nullable=False)
+    # sha256 do arquivo enviado; o mesmo arquivo não é gravado duas vezes
+    content_hash = Column(String(64))
+
+
+class DashboardRollup(Base):
+    __tablename__ = "dashboard_rollup"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # 0 = vendas cadastradas manualmente (sem upload de planilha)
+    historic_dashboard_id = Column(Integer, nullable=False, server_default="0")
+    mes = Column(Date, nullable=False)
+    # total, forma_pagamento, categoria_produto, nome_produto ou dia_semana
+    dimensao = Column(String, nullable=False)
+    valor = Column(String, nullable=False, server_default="")
+    total_vendas = Column(Integer, nullable=False)
+    total_valor_bruto = Column(Float, nullable=False)
+    total_valor_liquido = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "historic_dashboard_id", "mes", "dimensao", "valor",
+            name="uq_dashboard_rollup_chave"
+        ),
+    )
+
+
+class UploadJob(Base):
+    __tablename__ = "upload_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Preenchido só quando o job termina (o histórico é criado na mesma transação das vendas)
+    historic_dashboard_id = Column(Integer, ForeignKey("historic_dashboard.id"))
+    # pending, running, done ou failed
+    status = Column(String, nullable=False, server_default="pending")
+    filename = Column(String)
+    # Vazio nos uploads em lote: os arquivos ficam em upload_job_files
+    arquivo = Column(LargeBinary)
+    data_upload_planilha = Column(DateTime, nullable=False)
+    # Um item por histórico criado: arquivo, aba, id_historico, linhas e linhas ignoradas
+    parts = Column(JSON)
+    rows_parsed = Column(Integer, nullable=False, server_default="0")
+    rows_inserted = Column(Integer, nullable=False, server_default="0")
+    # Linhas (ou arquivos inteiros) que o usuário já tinha enviado
+    rows_skipped = Column(Integer, nullable=False, server_default="0")
+    errors = Column(Text)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    files = relationship("UploadJobFile", order_by="UploadJobFile.position", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_upload_jobs_status_id", "status", "id"),
+    )
+
+
+class UploadJobFile(Base):
+    __tablename__ = "upload_job_files"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(Integer, ForeignKey("upload_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    filename = Column(String)
+    arquivo = Column(LargeBinary, nullable=False)
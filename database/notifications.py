@@ -0,0 +1,16 @@
+"""
+Aviso, pelo LISTEN/NOTIFY do PostgreSQL, de que os dados de um usuário
+mudaram fora do processo da API (nos workers de upload).
+
+O NOTIFY vai na transação da escrita: o PostgreSQL só entrega a mensagem
+no commit, então quem escuta nunca é avisado antes de os dados estarem
+visíveis, e uma transação desfeita não avisa ninguém.
+"""
+from sqlalchemy import func, select
+
+
+USER_DATA_CHANNEL = 'user_data_changed'
+
+
+def notify_user_data_changed(db_session, user_id: int):
+    db_session.execute(select(func.pg_notify(USER_DATA_CHANNEL, str(user_id))))
@@ -0,0 +1,197 @@
+"""
+Configuração e estatísticas dos pools de conexão.
+
+Tamanho, overflow, timeout, recycle e a estratégia de pre-ping vêm de
+variáveis de ambiente (valem por processo: cada worker do uvicorn e cada
+worker de upload tem o seu pool). As estatísticas são montadas a partir
+dos eventos do pool do SQLAlchemy; o tempo de espera por uma conexão é
+medido no próprio pool (InstrumentedQueuePool), já que não há evento
+para o início do checkout.
+
+DATABASE_POOL_PRE_PING:
+    always  testa a conexão a cada checkout (pool_pre_ping do SQLAlchemy)
+    idle    testa só conexões paradas há mais de DATABASE_POOL_PRE_PING_IDLE segundos
+    never   não testa; conexões mortas só são descartadas ao falhar
+"""
+import threading
+import time
+from bisect import bisect_left
+from os import getenv
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+DATABASE_POOL_SIZE = int(getenv('DATABASE_POOL_SIZE', 5))
+DATABASE_MAX_OVERFLOW = int(getenv('DATABASE_MAX_OVERFLOW', 10))
+DATABASE_POOL_TIMEOUT = float(getenv('DATABASE_POOL_TIMEOUT', 30))
+DATABASE_POOL_RECYCLE = int(getenv('DATABASE_POOL_RECYCLE', 1800))
+DATABASE_POOL_PRE_PING = getenv('DATABASE_POOL_PRE_PING', 'idle')
+DATABASE_POOL_PRE_PING_IDLE = float(getenv('DATABASE_POOL_PRE_PING_IDLE', 30))
+
+PRE_PING_STRATEGIES = ('always', 'idle', 'never')
+
+# Limites (em segundos) dos buckets do histograma de espera por conexão
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def pool_options() -> dict:
+    if DATABASE_POOL_PRE_PING not in PRE_PING_STRATEGIES:
+        raise ValueError(
+            f"DATABASE_POOL_PRE_PING inválido: {DATABASE_POOL_PRE_PING} "
+            f"(use {', '.join(PRE_PING_STRATEGIES)})"
+        )
+
+    return {
+        'pool_size': DATABASE_POOL_SIZE,
+        'max_overflow': DATABASE_MAX_OVERFLOW,
+        'pool_timeout': DATABASE_POOL_TIMEOUT,
+        'pool_recycle': DATABASE_POOL_RECYCLE,
+        'pool_pre_ping': DATABASE_POOL_PRE_PING == 'always',
+    }
+
+
+class PoolStats:
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.pings = 0
+        self.ping_failures = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def wait_histogram(self) -> list:
+        # Acumulado por limite superior, como um histograma do Prometheus
+        histogram = []
+        total = 0
+        for bound, count in zip(WAIT_BUCKETS + ('+Inf',), self.wait_buckets):
+            total += count
+            histogram.append({'le': bound, 'count': total})
+        return histogram
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        with self._lock:
+            return {
+                'pool_size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'checked_out': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'pings': self.pings,
+                'ping_failures': self.ping_failures,
+                'wait': {
+                    'count': self.wait_count,
+                    'total_seconds': round(self.wait_total, 6),
+                    'max_seconds': round(self.wait_max, 6),
+                    'avg_seconds': round(self.wait_total / self.wait_count, 6) if self.wait_count else 0.0,
+                    'histogram': self.wait_histogram()
+                }
+            }
+
+
+class _WaitTimingMixin:
+    """
+    Mede quanto tempo cada checkout esperou por uma conexão (incluindo a
+    abertura de uma conexão nova, quando o pool precisa criar uma) e conta
+    os checkouts que estouraram o pool_timeout.
+    """
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            if self.stats is not None:
+                self.stats.increment('timeouts')
+            raise
+        if self.stats is not None:
+            self.stats.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() troca o pool: as estatísticas continuam as mesmas
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_WaitTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+pool_stats = {}
+
+
+def instrument_engine(name: str, engine) -> PoolStats:
+    """
+    Registra os eventos de estatística (e o pre-ping `idle`) no pool do
+    engine. Para um AsyncEngine, passe `async_engine.sync_engine`.
+    """
+    stats = PoolStats(name, engine)
+    engine.pool.stats = stats
+    pool_stats[name] = stats
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        stats.increment('connects')
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.increment('checkouts')
+
+        if DATABASE_POOL_PRE_PING != 'idle':
+            return
+
+        checkin_at = connection_record.info.get('checkin_at')
+        if checkin_at is None or time.monotonic() - checkin_at < DATABASE_POOL_PRE_PING_IDLE:
+            return
+
+        stats.increment('pings')
+        try:
+            alive = engine.dialect.do_ping(dbapi_connection)
+        except engine.dialect.loaded_dbapi.Error:
+            alive = False
+        if not alive:
+            stats.increment('ping_failures')
+            # O pool descarta a conexão e tenta outra
+            raise exc.DisconnectionError('Conexão parada não respondeu ao ping')
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        stats.increment('checkins')
+        connection_record.info['checkin_at'] = time.monotonic()
+
+    @event.listens_for(engine, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.increment('invalidations')
+
+    return stats
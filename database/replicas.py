@@ -0,0 +1,155 @@
+"""
+Réplicas de leitura (opcional).
+
+Com DATABASE_REPLICA_URLS (URLs separadas por vírgula) as rotas só de
+leitura abrem a sessão numa réplica, em round-robin; as escritas continuam
+no primário (database.connection). Sem réplicas configuradas, tudo vai ao
+primário como antes.
+
+Saúde das réplicas:
+- o checkout da conexão é o teste: se falhar, a réplica fica fora por
+  DATABASE_REPLICA_RETRY segundos e a leitura tenta a próxima;
+- a cada DATABASE_REPLICA_CHECK_INTERVAL segundos o atraso de replicação é
+  medido; acima de DATABASE_REPLICA_MAX_LAG a réplica fica fora até a
+  próxima medição;
+- sem nenhuma réplica disponível, a leitura vai ao primário.
+
+Read-your-writes: depois de uma escrita do usuário (pin), as leituras dele
+vão ao primário por DATABASE_REPLICA_PIN_SECONDS. O pin vale por processo,
+como o cache de respostas.
+"""
+import logging
+import threading
+import time
+from os import getenv
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from database.connection import AsyncSession, async_database_url
+from database.pool import InstrumentedAsyncAdaptedQueuePool, instrument_engine, pool_options
+
+
+DATABASE_REPLICA_URLS = [url.strip() for url in getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+DATABASE_REPLICA_RETRY = float(getenv('DATABASE_REPLICA_RETRY', 30))
+DATABASE_REPLICA_CHECK_INTERVAL = float(getenv('DATABASE_REPLICA_CHECK_INTERVAL', 5))
+DATABASE_REPLICA_MAX_LAG = float(getenv('DATABASE_REPLICA_MAX_LAG', 5))
+DATABASE_REPLICA_PIN_SECONDS = float(getenv('DATABASE_REPLICA_PIN_SECONDS', 10))
+
+# Segundos de atraso da réplica; 0 se ela já aplicou tudo o que recebeu
+# (pg_last_xact_replay_timestamp fica parado quando o primário não tem escritas)
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = create_async_engine(
+            async_database_url(url), poolclass=InstrumentedAsyncAdaptedQueuePool, **pool_options()
+        )
+        instrument_engine(name, self.engine.sync_engine)
+        self.sessionmaker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.unavailable_until = 0.0
+        self.checked_at = None
+        self.lag = None
+        self.errors = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.unavailable_until
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "available": self.available(now),
+            "lag": self.lag,
+            "errors": self.errors,
+            "retry_in": round(max(self.unavailable_until - now, 0), 1)
+        }
+
+
+class ReplicaRouter:
+    def __init__(self, urls: list):
+        self.replicas = [Replica(f"replica{index}", url) for index, url in enumerate(urls)]
+        self.routed = {}
+        self._next = 0
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def pin(self, user_id: int):
+        if self.replicas:
+            with self._lock:
+                self._pins[user_id] = time.monotonic() + DATABASE_REPLICA_PIN_SECONDS
+
+    def pinned(self, user_id: int) -> bool:
+        with self._lock:
+            until = self._pins.get(user_id)
+            if until is not None and until <= time.monotonic():
+                del self._pins[user_id]
+                until = None
+        return until is not None
+
+    def _rotation(self) -> list:
+        # Réplicas disponíveis, começando pela próxima da vez
+        now = time.monotonic()
+        available = [replica for replica in self.replicas if replica.available(now)]
+        if not available:
+            return []
+        with self._lock:
+            start = self._next % len(available)
+            self._next += 1
+        return available[start:] + available[:start]
+
+    def _count(self, name: str):
+        with self._lock:
+            self.routed[name] = self.routed.get(name, 0) + 1
+
+    async def _check(self, replica: Replica, session) -> bool:
+        await session.connection()
+
+        now = time.monotonic()
+        if replica.checked_at is None or now - replica.checked_at >= DATABASE_REPLICA_CHECK_INTERVAL:
+            replica.lag = float((await session.execute(REPLICA_LAG_SQL)).scalar())
+            replica.checked_at = now
+            if replica.lag > DATABASE_REPLICA_MAX_LAG:
+                replica.unavailable_until = now + DATABASE_REPLICA_CHECK_INTERVAL
+                logger.warning('Réplica %s atrasada %.1fs; usando outra', replica.name, replica.lag)
+                return False
+        return True
+
+    async def session(self, user_id: int = None):
+        """
+        Sessão assíncrona para uma leitura: numa réplica disponível ou, se o
+        usuário acabou de escrever ou nenhuma responder, no primário.
+        """
+        if self.replicas and user_id is not None and not self.pinned(user_id):
+            for replica in self._rotation():
+                session = replica.sessionmaker()
+                try:
+                    if await self._check(replica, session):
+                        self._count(replica.name)
+                        return session
+                except (SQLAlchemyError, OSError) as e:
+                    replica.errors += 1
+                    replica.unavailable_until = time.monotonic() + DATABASE_REPLICA_RETRY
+                    logger.warning('Réplica %s indisponível: %s', replica.name, e)
+                await session.close()
+
+        self._count('primary')
+        return AsyncSession()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            routed = dict(self.routed)
+            pinned_users = sum(1 for until in self._pins.values() if until > now)
+        return {
+            "replicas": {replica.name: replica.snapshot(now) for replica in self.replicas},
+            "routed": routed,
+            "pinned_users": pinned_users
+        }
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
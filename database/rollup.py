@@ -0,0 +1,126 @@
+"""
+Manutenção da tabela `dashboard_rollup`, o resumo por (usuário, upload, mês)
+de onde o dashboard lê as suas métricas.
+
+Cada escrita em `planilhas` aplica aqui o delta das linhas afetadas:
+`sign=1` depois de inserir, `sign=-1` antes de alterar ou remover.
+
+Backfill dos dados existentes:
+    python -m database.rollup [--user-id ID]
+"""
+import argparse
+from sqlalchemy import Date, String, and_, case, cast, delete, func, literal, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from database.models import DashboardRollup, PlanilhaModel
+
+
+DIMENSOES = {
+    # GROUPING(forma_pagamento, categoria_produto, nome_produto, dia_semana)
+    0b1111: 'total',
+    0b0111: 'forma_pagamento',
+    0b1011: 'categoria_produto',
+    0b1101: 'nome_produto',
+    0b1110: 'dia_semana',
+}
+
+
+def build_rollup_select(condition, sign: int = 1):
+    base = (
+        select(
+            PlanilhaModel.user_id,
+            func.coalesce(PlanilhaModel.historic_dashboard_id, 0).label('historic_dashboard_id'),
+            cast(func.date_trunc('month', PlanilhaModel.data_venda), Date).label('mes'),
+            PlanilhaModel.forma_pagamento,
+            PlanilhaModel.categoria_produto,
+            PlanilhaModel.nome_produto,
+            cast(func.extract('dow', PlanilhaModel.data_venda), String).label('dia_semana'),
+            PlanilhaModel.valor_bruto,
+            PlanilhaModel.valor_liquido
+        )
+        .where(condition)
+        .cte('vendas_delta')
+    )
+
+    chave = (base.c.user_id, base.c.historic_dashboard_id, base.c.mes)
+    dimensoes = (base.c.forma_pagamento, base.c.categoria_produto, base.c.nome_produto, base.c.dia_semana)
+
+    return (
+        select(
+            *chave,
+            case(DIMENSOES, value=func.grouping(*dimensoes)).label('dimensao'),
+            func.coalesce(*dimensoes, literal('')).label('valor'),
+            (func.count() * sign).label('total_vendas'),
+            (func.sum(base.c.valor_bruto) * sign).label('total_valor_bruto'),
+            (func.sum(base.c.valor_liquido) * sign).label('total_valor_liquido')
+        )
+        .group_by(
+            func.grouping_sets(*(tuple_(*chave, dimensao) for dimensao in dimensoes), tuple_(*chave))
+        )
+    )
+
+
+def apply_rollup_delta(db_session, user_id, condition, sign: int = 1):
+    """
+    Soma (ou subtrai, com sign=-1) ao rollup as vendas de `planilhas` que
+    satisfazem `condition`. Roda na transação da sessão, junto com a escrita.
+    """
+    if user_id is not None:
+        # Com o user_id na condição o PostgreSQL só lê a partição do usuário
+        condition = and_(PlanilhaModel.user_id == user_id, condition)
+
+    colunas = [
+        'user_id', 'historic_dashboard_id', 'mes', 'dimensao', 'valor',
+        'total_vendas', 'total_valor_bruto', 'total_valor_liquido'
+    ]
+    stmt = insert(DashboardRollup).from_select(colunas, build_rollup_select(condition, sign))
+    stmt = stmt.on_conflict_do_update(
+        constraint='uq_dashboard_rollup_chave',
+        set_={
+            'total_vendas': DashboardRollup.total_vendas + stmt.excluded.total_vendas,
+            'total_valor_bruto': DashboardRollup.total_valor_bruto + stmt.excluded.total_valor_bruto,
+            'total_valor_liquido': DashboardRollup.total_valor_liquido + stmt.excluded.total_valor_liquido,
+        }
+    )
+    db_session.execute(stmt)
+
+    if sign < 0:
+        # Remove os grupos que ficaram sem nenhuma venda
+        db_session.execute(
+            delete(DashboardRollup).where(
+                DashboardRollup.user_id == user_id,
+                DashboardRollup.total_vendas <= 0
+            )
+        )
+
+
+def remove_rollup_historic(db_session, user_id: int, historic_dashboard_id: int):
+    # O rollup é agrupado por upload: remover um upload é apagar as linhas dele
+    db_session.execute(
+        delete(DashboardRollup).where(
+            DashboardRollup.user_id == user_id,
+            DashboardRollup.historic_dashboard_id == historic_dashboard_id
+        )
+    )
+
+
+def backfill_rollup(db_session, user_id: int = None):
+    if user_id is None:
+        db_session.execute(delete(DashboardRollup))
+        condition = true()
+    else:
+        db_session.execute(delete(DashboardRollup).where(DashboardRollup.user_id == user_id))
+        condition = PlanilhaModel.user_id == user_id
+
+    apply_rollup_delta(db_session, user_id, condition)
+
+
+if __name__ == '__main__':
+    from database.connection import Session
+
+    parser = argparse.ArgumentParser(description='Recalcula a tabela dashboard_rollup a partir de planilhas.')
+    parser.add_argument('--user-id', type=int, default=None)
+    args = parser.parse_args()
+
+    with Session() as session:
+        backfill_rollup(session, args.user_id)
+        session.commit()
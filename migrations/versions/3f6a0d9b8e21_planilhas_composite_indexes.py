@@ -0,0 +1,40 @@
+"""Planilhas composite indexes
+
+Revision ID: 3f6a0d9b8e21
+Revises: 9c7d1a2e4b60
+Create Date: 2026-10-18 11:47:05.660913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '3f6a0d9b8e21'
+down_revision: Union[str, None] = '9c7d1a2e4b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY não bloqueia as escritas em planilhas, mas não roda dentro de transação
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_planilhas_user_id_data_venda', 'planilhas', ['user_id', 'data_venda'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_planilhas_user_id_historic_dashboard_id', 'planilhas', ['user_id', 'historic_dashboard_id'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_historic_dashboard_user_id', 'historic_dashboard', ['user_id'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_historic_dashboard_user_id', table_name='historic_dashboard', postgresql_concurrently=True)
+        op.drop_index('ix_planilhas_user_id_historic_dashboard_id', table_name='planilhas', postgresql_concurrently=True)
+        op.drop_index('ix_planilhas_user_id_data_venda', table_name='planilhas', postgresql_concurrently=True)
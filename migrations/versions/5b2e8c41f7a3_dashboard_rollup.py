@@ -0,0 +1,39 @@
+"""Dashboard rollup
+
+Revision ID: 5b2e8c41f7a3
+Revises: d84036e39d13
+Create Date: 2026-10-18 10:12:31.402518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '5b2e8c41f7a3'
+down_revision: Union[str, None] = 'd84036e39d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'dashboard_rollup',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('historic_dashboard_id', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('mes', sa.Date(), nullable=False),
+        sa.Column('dimensao', sa.String(), nullable=False),
+        sa.Column('valor', sa.String(), server_default='', nullable=False),
+        sa.Column('total_vendas', sa.Integer(), nullable=False),
+        sa.Column('total_valor_bruto', sa.Float(), nullable=False),
+        sa.Column('total_valor_liquido', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'historic_dashboard_id', 'mes', 'dimensao', 'valor', name='uq_dashboard_rollup_chave')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('dashboard_rollup')
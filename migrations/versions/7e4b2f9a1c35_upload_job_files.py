@@ -0,0 +1,38 @@
+"""Batch upload files
+
+Revision ID: 7e4b2f9a1c35
+Revises: 3f6a0d9b8e21
+Create Date: 2026-10-18 18:42:10.512347
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '7e4b2f9a1c35'
+down_revision: Union[str, None] = '3f6a0d9b8e21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('upload_jobs', sa.Column('parts', sa.JSON(), nullable=True))
+    op.create_table(
+        'upload_job_files',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(), nullable=True),
+        sa.Column('arquivo', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['job_id'], ['upload_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_job_files_job_id'), 'upload_job_files', ['job_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_upload_job_files_job_id'), table_name='upload_job_files')
+    op.drop_table('upload_job_files')
+    op.drop_column('upload_jobs', 'parts')
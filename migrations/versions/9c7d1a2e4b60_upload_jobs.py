@@ -0,0 +1,47 @@
+"""Upload jobs
+
+Revision ID: 9c7d1a2e4b60
+Revises: 5b2e8c41f7a3
+Create Date: 2026-10-18 11:03:48.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '9c7d1a2e4b60'
+down_revision: Union[str, None] = '5b2e8c41f7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'upload_jobs',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('historic_dashboard_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(), server_default='pending', nullable=False),
+        sa.Column('filename', sa.String(), nullable=True),
+        sa.Column('arquivo', sa.LargeBinary(), nullable=True),
+        sa.Column('data_upload_planilha', sa.DateTime(), nullable=False),
+        sa.Column('rows_parsed', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('rows_inserted', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('errors', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['historic_dashboard_id'], ['historic_dashboard.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upload_jobs_status_id', 'upload_jobs', ['status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_upload_jobs_status_id', table_name='upload_jobs')
+    op.drop_table('upload_jobs')
@@ -0,0 +1,97 @@
+"""Upload deduplication
+
+Revision ID: b5d19e7c3a48
+Revises: 7e4b2f9a1c35
+Create Date: 2026-10-18 16:02:41.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b5d19e7c3a48'
+down_revision: Union[str, None] = '7e4b2f9a1c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Vendas lidas e fingerprints gravados por vez no backfill
+BACKFILL_BATCH_SIZE = 10000
+
+SALE_COLUMNS = (
+    'id', 'user_id', 'historic_dashboard_id', 'data_venda', 'data_pagamento', 'valor_bruto',
+    'valor_liquido', 'taxa', 'forma_pagamento', 'nome_produto', 'categoria_produto'
+)
+
+# Se as vendas antigas já estão repetidas entre históricos, só a primeira
+# cópia recebe o fingerprint
+APPLY_FINGERPRINTS = """
+UPDATE planilhas AS p
+SET fingerprint = f.fingerprint
+FROM (
+    SELECT id, fingerprint, row_number() OVER (PARTITION BY user_id, fingerprint ORDER BY id) AS copia
+    FROM backfill_fingerprints
+) AS f
+WHERE p.id = f.id AND f.copia = 1
+"""
+
+
+def backfill_fingerprints(connection) -> None:
+    """
+    Calcula o fingerprint das vendas antigas com app.ingestion.RowFingerprints,
+    contando a ocorrência por histórico (cada histórico é um arquivo): um novo
+    upload do mesmo arquivo gera exatamente os mesmos fingerprints. Montar o
+    texto em SQL não bate com o Python (-0.0, arredondamento de float8).
+    """
+    from app.ingestion import RowFingerprints
+
+    connection.execute(sa.text(
+        'CREATE TEMPORARY TABLE backfill_fingerprints '
+        '(id integer PRIMARY KEY, user_id integer, fingerprint varchar(32))'
+    ))
+    fingerprints_table = sa.table(
+        'backfill_fingerprints', sa.column('id'), sa.column('user_id'), sa.column('fingerprint')
+    )
+    planilhas = sa.table('planilhas', *(sa.column(name) for name in SALE_COLUMNS))
+
+    result = connection.execute(
+        sa.select(planilhas)
+        .where(planilhas.c.historic_dashboard_id.isnot(None))
+        .order_by(planilhas.c.historic_dashboard_id, planilhas.c.id)
+        .execution_options(yield_per=BACKFILL_BATCH_SIZE)
+    )
+    historic_id, fingerprints = None, None
+    for rows in result.mappings().partitions():
+        batch = []
+        for row in rows:
+            if row['historic_dashboard_id'] != historic_id:
+                historic_id, fingerprints = row['historic_dashboard_id'], RowFingerprints()
+            sale = fingerprints.add(dict(row))
+            batch.append({'id': sale['id'], 'user_id': sale['user_id'], 'fingerprint': sale['fingerprint']})
+        connection.execute(fingerprints_table.insert(), batch)
+
+    connection.execute(sa.text(APPLY_FINGERPRINTS))
+    connection.execute(sa.text('DROP TABLE backfill_fingerprints'))
+
+
+def upgrade() -> None:
+    op.add_column('planilhas', sa.Column('fingerprint', sa.String(length=32), nullable=True))
+    op.add_column('historic_dashboard', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('upload_jobs', sa.Column('rows_skipped', sa.Integer(), server_default='0', nullable=False))
+    backfill_fingerprints(op.get_bind())
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_planilhas_user_id_fingerprint', 'planilhas', ['user_id', 'fingerprint'],
+            unique=True, postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('uq_planilhas_user_id_fingerprint', table_name='planilhas', postgresql_concurrently=True)
+    op.drop_column('upload_jobs', 'rows_skipped')
+    op.drop_column('historic_dashboard', 'content_hash')
+    op.drop_column('planilhas', 'fingerprint')
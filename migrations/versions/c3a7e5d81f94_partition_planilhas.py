@@ -0,0 +1,95 @@
+"""Partition planilhas by user
+
+Revision ID: c3a7e5d81f94
+Revises: b5d19e7c3a48
+Create Date: 2026-10-18 17:21:09.542118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c3a7e5d81f94'
+down_revision: Union[str, None] = 'b5d19e7c3a48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# database.models.PLANILHAS_PARTITIONS no momento desta migração
+PARTITIONS = 16
+
+COLUMNS = (
+    'id, user_id, data_venda, data_pagamento, valor_bruto, valor_liquido, taxa, '
+    'forma_pagamento, nome_produto, categoria_produto, historic_dashboard_id, fingerprint'
+)
+
+
+def create_planilhas(*constraints, **kwargs) -> None:
+    op.create_table(
+        'planilhas',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('planilhas_id_seq')"), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('data_venda', sa.Date(), nullable=False),
+        sa.Column('data_pagamento', sa.Date(), nullable=False),
+        sa.Column('valor_bruto', sa.Float(), nullable=False),
+        sa.Column('valor_liquido', sa.Float(), nullable=False),
+        sa.Column('taxa', sa.Float(), nullable=False),
+        sa.Column('forma_pagamento', sa.String(), nullable=False),
+        sa.Column('nome_produto', sa.String(), nullable=False),
+        sa.Column('categoria_produto', sa.String(), nullable=False),
+        sa.Column('historic_dashboard_id', sa.Integer(), nullable=True),
+        sa.Column('fingerprint', sa.String(length=32), nullable=True),
+        sa.ForeignKeyConstraint(['historic_dashboard_id'], ['historic_dashboard.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        *constraints,
+        **kwargs
+    )
+
+
+def create_indexes() -> None:
+    # Depois da cópia: construir os índices de uma vez é bem mais rápido
+    op.create_index('ix_planilhas_user_id_data_venda', 'planilhas', ['user_id', 'data_venda'])
+    op.create_index('ix_planilhas_user_id_historic_dashboard_id', 'planilhas', ['user_id', 'historic_dashboard_id'])
+    op.create_index('uq_planilhas_user_id_fingerprint', 'planilhas', ['user_id', 'fingerprint'], unique=True)
+
+
+def replace_planilhas(primary_key, **kwargs) -> None:
+    """
+    Recria `planilhas` e copia as vendas, mantendo os ids e a sequence.
+    As escritas na tabela ficam bloqueadas até o fim da migração.
+    """
+    op.rename_table('planilhas', 'planilhas_old')
+    op.execute('ALTER TABLE planilhas_old RENAME CONSTRAINT planilhas_pkey TO planilhas_old_pkey')
+    op.drop_index('uq_planilhas_user_id_fingerprint', table_name='planilhas_old')
+    op.drop_index('ix_planilhas_user_id_historic_dashboard_id', table_name='planilhas_old')
+    op.drop_index('ix_planilhas_user_id_data_venda', table_name='planilhas_old')
+    op.execute('ALTER SEQUENCE planilhas_id_seq OWNED BY NONE')
+
+    create_planilhas(primary_key, **kwargs)
+    if 'postgresql_partition_by' in kwargs:
+        for remainder in range(PARTITIONS):
+            op.execute(
+                f'CREATE TABLE planilhas_p{remainder} PARTITION OF planilhas '
+                f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+            )
+
+    op.execute(f'INSERT INTO planilhas ({COLUMNS}) SELECT {COLUMNS} FROM planilhas_old')
+    op.drop_table('planilhas_old')
+    op.execute('ALTER SEQUENCE planilhas_id_seq OWNED BY planilhas.id')
+    create_indexes()
+    op.execute('ANALYZE planilhas')
+
+
+def upgrade() -> None:
+    # user_id entra na chave primária (e vira NOT NULL): a cópia falha se houver vendas sem usuário
+    replace_planilhas(
+        sa.PrimaryKeyConstraint('id', 'user_id', name='planilhas_pkey'),
+        postgresql_partition_by='HASH (user_id)'
+    )
+
+
+def downgrade() -> None:
+    replace_planilhas(sa.PrimaryKeyConstraint('id', name='planilhas_pkey'))
+    op.alter_column('planilhas', 'user_id', nullable=True)
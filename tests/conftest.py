@@ -0,0 +1,66 @@
+"""
+Os testes rodam contra um PostgreSQL com as migrations aplicadas, indicado
+por DATABASE_URL; sem ele, são pulados. Tudo o que um teste grava fica numa
+transação desfeita no final, então pode ser o banco de desenvolvimento.
+"""
+from datetime import datetime
+from os import getenv
+from uuid import uuid4
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from database.models import HistoricDashboard, PlanilhaModel, UserModel
+
+
+@pytest.fixture
+def database_url() -> str:
+    url = getenv('DATABASE_URL')
+    if not url:
+        pytest.skip('DATABASE_URL não configurada')
+    return url
+
+
+@pytest.fixture
+def session(database_url):
+    from database.connection import engine
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        db_session = Session(bind=connection, join_transaction_mode='create_savepoint')
+        try:
+            yield db_session
+        finally:
+            db_session.close()
+            transaction.rollback()
+
+
+@pytest.fixture
+def create_sales(database_url):
+    """
+    Cria um usuário com `uploads` uploads de `sales` vendas sintéticas cada
+    e o rollup dele; devolve (user_id, ids dos uploads).
+    """
+    from benchmarks.synthetic import generate_rows
+    from database.rollup import backfill_rollup
+
+    def create(db_session, uploads: int = 3, sales: int = 2000) -> tuple:
+        user = UserModel(username=f'test-{uuid4().hex}', password='test')
+        db_session.add(user)
+        db_session.flush()
+
+        historic_ids = []
+        for index in range(uploads):
+            historic = HistoricDashboard(user_id=user.id, data_upload_planilha=datetime.now())
+            db_session.add(historic)
+            db_session.flush()
+            db_session.execute(
+                insert(PlanilhaModel),
+                generate_rows(sales, user.id, seed=index, historic_dashboard_id=historic.id)
+            )
+            historic_ids.append(historic.id)
+
+        backfill_rollup(db_session, user.id)
+        db_session.flush()
+        return user.id, historic_ids
+
+    return create
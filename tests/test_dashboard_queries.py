@@ -0,0 +1,57 @@
+"""
+O dashboard sai do rollup numa única ida ao banco; com granularidade
+diferente de `month` a série vem de uma segunda consulta agrupada.
+"""
+import asyncio
+import pytest
+from database.instrumentation import count_queries
+
+
+def dashboard(create_sales, granularity: str) -> tuple:
+    """
+    Cria as vendas numa transação desfeita no final e devolve (resposta do
+    dashboard, queries executadas para montá-la).
+    """
+    from app.auth_user import Principal
+    from app.depends import get_data_dashboard_async
+    from database.connection import AsyncSession, async_engine
+
+    async def run():
+        async with async_engine.connect() as connection:
+            transaction = await connection.begin()
+            db_session = AsyncSession(bind=connection, join_transaction_mode='create_savepoint')
+            try:
+                user_id, _ = await db_session.run_sync(create_sales)
+                with count_queries() as queries:
+                    data = await get_data_dashboard_async(Principal(user_id, 'test'), db_session, granularity=granularity)
+                return data, queries.count
+            finally:
+                await db_session.close()
+                await transaction.rollback()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        # O pool async fica preso ao event loop do asyncio.run
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.mark.parametrize('granularity, expected', [
+    ('month', 1),
+    ('quarter', 2),
+    ('year', 2),
+    ('week', 2),
+    ('day', 2),
+])
+def test_dashboard_query_count(create_sales, granularity, expected):
+    _, queries = dashboard(create_sales, granularity)
+    assert queries == expected
+
+
+def test_dashboard_orders_by_sales(create_sales):
+    data, _ = dashboard(create_sales, 'month')
+    for key in ('vendas_por_categoria', 'produtos_servicos'):
+        items = [item for item in data[key] if item['id'] != 'outros']
+        assert len(items) == 6
+        values = [item['value'] for item in items]
+        assert values == sorted(values, reverse=True), key
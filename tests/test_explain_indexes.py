@@ -0,0 +1,87 @@
+"""
+Confere com EXPLAIN que as consultas das rotas usam os índices compostos
+de `planilhas` e `historic_dashboard` em vez de um seq scan. Cada consulta
+precisa ler pelo índice esperado (ou pelos índices das partições dele), com
+a coluna filtrada na condição do índice (Index Cond), não só como filtro
+aplicado depois da leitura.
+
+Seq scan é desabilitado na transação (enable_seqscan = off) e as tabelas
+são analisadas com os dados do teste, para o planner ter estatísticas.
+"""
+import json
+import pytest
+from sqlalchemy import select, text
+from app.filters import planilha_filters
+from database.models import HistoricDashboard, PlanilhaModel
+
+
+# nome: (índice esperado, coluna na condição do índice, consulta por (user_id, historic_id))
+CHECKS = {
+    'planilhas por usuário e meses selecionados': (
+        'ix_planilhas_user_id_data_venda',
+        'data_venda',
+        lambda user_id, historic_id: select(PlanilhaModel.id).where(
+            *planilha_filters(user_id, ['01/2024', '02/2024', '06/2024'])
+        )
+    ),
+    'planilhas por usuário e upload': (
+        'ix_planilhas_user_id_historic_dashboard_id',
+        'historic_dashboard_id',
+        lambda user_id, historic_id: select(PlanilhaModel.id).where(
+            *planilha_filters(user_id, id_historico=historic_id)
+        )
+    ),
+    'histórico do usuário': (
+        'ix_historic_dashboard_user_id',
+        'user_id',
+        lambda user_id, historic_id: select(HistoricDashboard.id).where(HistoricDashboard.user_id == user_id)
+    ),
+}
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def index_names(connection, index: str) -> set:
+    # Índice de tabela particionada: o plano lê os índices das partições.
+    # Índice inexistente não entra no plano e o teste falha
+    return {index} | set(connection.execute(
+        text('SELECT relid::regclass::text FROM pg_partition_tree(to_regclass(:index))'),
+        {'index': index}
+    ).scalars())
+
+
+def explain(connection, statement) -> list:
+    compiled = statement.compile(connection, compile_kwargs={'literal_binds': True})
+    result = connection.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}')).scalar()
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]['Plan']
+    return list(plan_nodes(plan))
+
+
+@pytest.fixture
+def planner(session, create_sales):
+    user_id, historic_ids = create_sales(session)
+    connection = session.connection()
+    connection.execute(text('ANALYZE planilhas'))
+    connection.execute(text('ANALYZE historic_dashboard'))
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    return connection, user_id, historic_ids[0]
+
+
+@pytest.mark.parametrize('name', CHECKS)
+def test_query_uses_composite_index(planner, name):
+    connection, user_id, historic_id = planner
+    index, column, build = CHECKS[name]
+
+    expected = index_names(connection, index)
+    nodes = explain(connection, build(user_id, historic_id))
+    used = {node['Index Name'] for node in nodes if 'Index Name' in node}
+
+    assert not any(node['Node Type'] == 'Seq Scan' for node in nodes), f'{name}: seq scan'
+    assert used and used <= expected, f'{name}: esperado {index}, usado {sorted(used)}'
+    assert any(
+        node.get('Index Name') in expected and column in node.get('Index Cond', '') for node in nodes
+    ), f'{name}: {column} fora da condição do índice'